@@ -1,9 +1,11 @@
 import time
-from machine import Pin, I2C, PWM
+import uasyncio as asyncio
+from machine import Pin, I2C, PWM, SPI
 from ssd1306 import SSD1306_I2C
 import network
-from umqtt.robust import MQTTClient
+from umqtt.simple import MQTTClient
 import ubinascii
+import ujson
 
 # WiFi Credentials
 SSID = "Your_WiFi_Name"
@@ -15,9 +17,12 @@ MQTT_PORT = 1883
 CLIENT_ID = "ESP32_Parking_" + ubinascii.hexlify(network.WLAN().config('mac')).decode()
 TOPIC_PREFIX = "parking_system_custom_123456/"
 TOPIC_PUB_SLOT = TOPIC_PREFIX + "slot_status"
+TOPIC_PUB_SLOT_DELTA = TOPIC_PREFIX + "slot_delta"
+TOPIC_PUB_HEARTBEAT = TOPIC_PREFIX + "heartbeat"
 TOPIC_PUB_GATE_STATUS = TOPIC_PREFIX + "gate_status"
 TOPIC_SUB_VEHICLE = TOPIC_PREFIX + "vehicle_status"
 TOPIC_SUB_GATE = TOPIC_PREFIX + "gate_control"
+TOPIC_SUB_ASSIGN = TOPIC_PREFIX + "slot_assign"
 
 # Hardware Setup
 i2c = I2C(0, scl=Pin(5), sda=Pin(4), freq=400000)
@@ -37,12 +42,109 @@ buzzer.duty(0)
 
 exit_ir_sensor = Pin(14, Pin.IN)
 
-slot1_ir_sensor = Pin(34, Pin.IN)
-slot2_ir_sensor = Pin(35, Pin.IN)
-slot3_ir_sensor = Pin(36, Pin.IN)
-slot4_ir_sensor = Pin(39, Pin.IN)
-slot5_ir_sensor = Pin(16, Pin.IN)
-slot6_ir_sensor = Pin(17, Pin.IN)
+# Slot sensors, in slot order. Each bank is read in one pass and fills the next run of slots:
+#   ("pins", (gpio, ...))       sensors wired straight to GPIOs; edges wake the scan
+#   ("shift", count)            chained 74HC165s on SHIFT_PINS, clocked out in one SPI transfer
+#   ("mux", (sig_gpio, ...), n) CD74HC4067s sharing MUX_SELECT_PINS, n channels each
+# Shift and mux banks have no interrupt line and are polled every SLOT_POLL_MS.
+SLOT_BANKS = [("pins", (34, 35, 36, 39, 16, 17))]
+SHIFT_PINS = (21, 22, 23)  # load, clock, data
+SHIFT_SPI_ID = 1
+SHIFT_BAUDRATE = 1000000
+# Free once a mux replaces the direct sensors on 16/17. The board has no fourth spare non-strapping output,
+# so a lot with both shift and mux banks must move one of them; build_slot_banks refuses overlapping pins.
+MUX_SELECT_PINS = (13, 16, 17, 21)
+# I2C, buzzer, exit sensor, servos and LEDs
+FIXED_PINS = (4, 5, 12, 14, 15, 18, 19, 25, 26, 27, 32, 33)
+
+class PinBank:
+    irq = True
+
+    def __init__(self, gpios):
+        self.pins = [Pin(gpio, Pin.IN) for gpio in gpios]
+        self.count = len(self.pins)
+
+    def read(self):
+        mask = 0
+        for i in range(self.count):
+            if self.pins[i].value() == 0:
+                mask |= 1 << i
+        return mask
+
+class ShiftBank:
+    irq = False
+
+    def __init__(self, count):
+        load, clock, data = SHIFT_PINS
+        self.count = count
+        self.load = Pin(load, Pin.OUT, value=1)
+        self.spi = SPI(SHIFT_SPI_ID, baudrate=SHIFT_BAUDRATE, sck=Pin(clock), miso=Pin(data))
+        self.buf = bytearray((count + 7) // 8)
+        self.bank_mask = (1 << count) - 1
+
+    def read(self):
+        # Latch every input at once, then shift the whole chain out; slot 0 is the last bit clocked out
+        self.load.value(0)
+        self.load.value(1)
+        self.spi.readinto(self.buf)
+        return ~int.from_bytes(self.buf, "big") & self.bank_mask
+
+class MuxBank:
+    irq = False
+    select = None
+
+    def __init__(self, gpios, channels=16):
+        if MuxBank.select is None:
+            MuxBank.select = [Pin(gpio, Pin.OUT) for gpio in MUX_SELECT_PINS]
+        self.sigs = [Pin(gpio, Pin.IN) for gpio in gpios]
+        self.channels = channels
+        self.count = len(self.sigs) * channels
+
+    def read(self):
+        # One select step reads that channel on every mux at once
+        mask = 0
+        for channel in range(self.channels):
+            for bit in range(len(MuxBank.select)):
+                MuxBank.select[bit].value(channel >> bit & 1)
+            for i in range(len(self.sigs)):
+                if self.sigs[i].value() == 0:
+                    mask |= 1 << (i * self.channels + channel)
+        return mask
+
+def check_slot_pins():
+    # Every GPIO the configured banks use must be free; shared select lines count once
+    used = {gpio: "fixed" for gpio in FIXED_PINS}
+    claims = []
+    for spec in SLOT_BANKS:
+        if spec[0] == "pins":
+            claims += [(gpio, "slot sensor") for gpio in spec[1]]
+        elif spec[0] == "shift":
+            claims += [(gpio, "shift") for gpio in SHIFT_PINS]
+        else:
+            claims += [(gpio, "mux signal") for gpio in spec[1]]
+            claims += [(gpio, "mux select") for gpio in MUX_SELECT_PINS]
+    for gpio, role in claims:
+        if gpio in used and not (role == used[gpio] and role in ("shift", "mux select")):
+            raise ValueError(f"GPIO{gpio} used as {role} is already the {used[gpio]} pin")
+        used[gpio] = role
+
+def build_slot_banks():
+    check_slot_pins()
+    banks = []
+    offset = 0
+    for spec in SLOT_BANKS:
+        if spec[0] == "pins":
+            bank = PinBank(spec[1])
+        elif spec[0] == "shift":
+            bank = ShiftBank(spec[1])
+        else:
+            bank = MuxBank(*spec[1:])
+        bank.offset = offset
+        offset += bank.count
+        banks.append(bank)
+    return banks
+
+slot_banks = build_slot_banks()
 
 entry_servo = PWM(Pin(18))
 entry_servo.freq(50)
@@ -60,7 +162,20 @@ exit_red_led.value(0)
 exit_yellow_led.value(0)
 exit_green_led.value(0)
 
-parking_slots = [False, False, False, False, False, False]
+# Slot state as a bitmask: bit i set means slot i+1 is occupied
+SLOT_COUNT = sum([bank.count for bank in slot_banks])
+FULL_MASK = (1 << SLOT_COUNT) - 1
+slot_mask = 0
+# Slots held for cars let in but not yet parked, as bit -> ticks deadline. Holds only affect availability and
+# the OLED; slot_mask, and everything published from it, stays what the sensors see
+held_mask = 0
+held_until = {}
+# Slots neither sensed occupied nor held, kept in step so availability checks never rescan the slots
+free_slots = SLOT_COUNT
+# Incremented for every published slot change; the heartbeat repeats the latest value so subscribers can spot gaps
+slot_seq = 0
+slots_changed = asyncio.Event()
+
 
 # MQTT Variables
 mqtt_connected = False
@@ -70,11 +185,43 @@ last_connection_check = 0
 # LED State Variables (NEW - to prevent flickering)
 current_entry_led_state = "NONE"
 current_exit_led_state = "NONE"
-last_display_update = 0
-last_slot_check = 0
+
+# Gate timing (milliseconds)
+GATE_OPEN_MS = 3000
+GATE_YELLOW_MS = 2000
+ENTRY_BEEP = ((300, 0),)
+EXIT_BEEP = ((200, 100), (200, 0))
+MQTT_POLL_MS = 20
+SLOT_DEBOUNCE_MS = 50
+SLOT_RESCAN_MS = 1000
+SLOT_POLL_MS = 200
+HEARTBEAT_MS = 60000
+# A held slot is released after this long unless its sensor sees the car arrive first
+SLOT_HOLD_MS = 120000
+
+# OLED layout: title, availability, then DISPLAY_ROWS rows of slots per page
+DISPLAY_COLUMNS = 3
+DISPLAY_FIRST_ROW = 24
+DISPLAY_ROWS = 5
+SLOTS_PER_PAGE = DISPLAY_COLUMNS * DISPLAY_ROWS
+DISPLAY_PAGES = (SLOT_COUNT + SLOTS_PER_PAGE - 1) // SLOTS_PER_PAGE
+DISPLAY_PAGE_MS = 3000
+display_page = 0
+
+# Events shared between interrupt handlers, the MQTT callback and the gate tasks.
+# ThreadSafeFlag is the only primitive that may be set from a hard IRQ.
+exit_flag = asyncio.ThreadSafeFlag()
+slot_flag = asyncio.ThreadSafeFlag()
+entry_request = asyncio.Event()
+entry_command = None
+# Slot the central occupancy service picked for the next car
+assigned_slot = None
+# Shown instead of the title while the entry gate is open
+banner = None
+buzzer_lock = asyncio.Lock()
 
 # MQTT Functions
-def connect_wifi():
+async def connect_wifi():
     wlan = network.WLAN(network.STA_IF)
     wlan.active(True)
     if not wlan.isconnected():
@@ -82,7 +229,7 @@ def connect_wifi():
         wlan.connect(SSID, PASSWORD)
         max_wait = 20
         while max_wait > 0 and not wlan.isconnected():
-            time.sleep(1)
+            await asyncio.sleep(1)
             max_wait -= 1
     if wlan.isconnected():
         print("WiFi Connected:", wlan.ifconfig())
@@ -101,108 +248,104 @@ def connect_mqtt():
         print("Connected to MQTT Broker")
         client.subscribe(TOPIC_SUB_GATE)
         client.subscribe(TOPIC_SUB_VEHICLE)
+        client.subscribe(TOPIC_SUB_ASSIGN)
         print("Subscribed to topics")
         mqtt_connected = True
         publish_message(TOPIC_PREFIX + "device_status", "ONLINE")
+        # Anything that changed while offline only exists locally, so restate it
+        publish_slot_state(0)
         return client
     except Exception as e:
         print("MQTT Connection Failed:", e)
         mqtt_connected = False
         return None
 
-def publish_message(topic, message):
+def publish_message(topic, message, retain=False):
     global mqtt_connected, client
     try:
         if mqtt_connected:
-            client.publish(topic, message)
+            client.publish(topic, message, retain)
             return True
     except Exception as e:
         print("Publish Error:", e)
         mqtt_connected = False
     return False
 
+def request_entry(command):
+    # Runs inside check_msg(); just hand the command to entry_gate_task
+    global entry_command
+    entry_command = command
+    entry_request.set()
+
+def assign_slot(message):
+    # FULL comes without an OPEN, the service refuses the car itself; it only drops any stale assignment
+    global assigned_slot
+    slot = None if message == "FULL" else int(message)
+    assigned_slot = slot if slot is not None and 1 <= slot <= SLOT_COUNT else None
+
 def mqtt_callback(topic, msg):
-    global entry_state, entry_timer, entry_gate_open
     try:
         t = topic.decode()
         m = msg.decode()
         print("MQTT Message:", t, "->", m)
         if t == TOPIC_SUB_GATE:
             if m == "OPEN" and get_available_slots() > 0:
-                entry_state = "GREEN"
-                entry_timer = time.ticks_ms()
+                request_entry("OPEN")
             elif m == "CLOSE":
-                entry_state = "YELLOW"
-                entry_timer = time.ticks_ms()
+                request_entry("CLOSE")
         elif t == TOPIC_SUB_VEHICLE:
             if m == "DETECTED" and get_available_slots() > 0:
-                entry_state = "GREEN"
-                entry_timer = time.ticks_ms()
+                request_entry("OPEN")
+        elif t == TOPIC_SUB_ASSIGN:
+            assign_slot(m)
     except Exception as e:
         print("Error in callback:", e)
 
-def reconnect_if_needed():
+async def mqtt_task():
     global client, mqtt_connected, last_connection_check
-    current_time = time.time()
-    if current_time - last_connection_check > 30:
-        last_connection_check = current_time
-        if not mqtt_connected:
+    while True:
+        current_time = time.time()
+        if not mqtt_connected and current_time - last_connection_check > 30:
+            last_connection_check = current_time
             if not network.WLAN(network.STA_IF).isconnected():
-                connect_wifi()
+                await connect_wifi()
             client = connect_mqtt()
+        if mqtt_connected:
+            try:
+                client.check_msg()
+            except Exception as e:
+                print("Error checking messages:", e)
+                mqtt_connected = False
+        await asyncio.sleep_ms(MQTT_POLL_MS)
 
 # IMPROVED LED Control Functions
 def set_entry_leds(state):
     global current_entry_led_state
     if current_entry_led_state != state:  # Only change if different
         current_entry_led_state = state
-        # Turn off all LEDs first
-        entry_red_led.value(0)
-        entry_yellow_led.value(0)
-        entry_green_led.value(0)
-        time.sleep(0.01)  # Small delay to ensure LEDs are off
-        
-        # Turn on the required LED
-        if state == "RED":
-            entry_red_led.value(1)
-        elif state == "YELLOW":
-            entry_yellow_led.value(1)
-        elif state == "GREEN":
-            entry_green_led.value(1)
+        entry_red_led.value(1 if state == "RED" else 0)
+        entry_yellow_led.value(1 if state == "YELLOW" else 0)
+        entry_green_led.value(1 if state == "GREEN" else 0)
         print(f"Entry LED set to: {state}")
 
 def set_exit_leds(state):
     global current_exit_led_state
     if current_exit_led_state != state:  # Only change if different
         current_exit_led_state = state
-        # Turn off all LEDs first
-        exit_red_led.value(0)
-        exit_yellow_led.value(0)
-        exit_green_led.value(0)
-        time.sleep(0.01)  # Small delay to ensure LEDs are off
-        
-        # Turn on the required LED
-        if state == "RED":
-            exit_red_led.value(1)
-        elif state == "YELLOW":
-            exit_yellow_led.value(1)
-        elif state == "GREEN":
-            exit_green_led.value(1)
+        exit_red_led.value(1 if state == "RED" else 0)
+        exit_yellow_led.value(1 if state == "YELLOW" else 0)
+        exit_green_led.value(1 if state == "GREEN" else 0)
         print(f"Exit LED set to: {state}")
 
-def entry_loud_beep():
-    buzzer.duty(512)  # Reduced duty cycle for better sound
-    time.sleep(0.3)
-    buzzer.duty(0)
-
-def exit_loud_beep():
-    buzzer.duty(512)  # Reduced duty cycle for better sound
-    time.sleep(0.2)
-    buzzer.duty(0)
-    time.sleep(0.1)
-    buzzer.duty(512)
-    time.sleep(0.2)
-    buzzer.duty(0)
+async def beep(pattern):
+    # pattern is ((on_ms, off_ms), ...); runs as its own task so the gate never waits for the buzzer
+    async with buzzer_lock:
+        for on_ms, off_ms in pattern:
+            buzzer.duty(512)  # Reduced duty cycle for better sound
+            await asyncio.sleep_ms(on_ms)
+            buzzer.duty(0)
+            if off_ms:
+                await asyncio.sleep_ms(off_ms)
 
 def entry_open_gate():
     entry_servo.duty(77)
@@ -221,160 +364,261 @@ def exit_close_gate():
     print("Exit gate closed")
 
 def get_available_slots():
-    return sum(1 for slot in parking_slots if not slot)
+    return free_slots
+
+def set_slot_state(mask, held):
+    # Single place slot state changes: publishes sensor changes and wakes the display only when something changed
+    global slot_mask, held_mask, free_slots
+    changed = mask ^ slot_mask
+    if not changed and held == held_mask:
+        return
+    taken_before = slot_mask | held_mask
+    taken = mask | held
+    free_slots += bin(taken_before & ~taken).count("1") - bin(taken & ~taken_before).count("1")
+    slot_mask = mask
+    held_mask = held
+    if changed:
+        print("Parking slots updated:", bin(mask))
+        publish_slot_state(changed)
+    slots_changed.set()
+
+def hold_slot(bit):
+    held_until[bit] = time.ticks_add(time.ticks_ms(), SLOT_HOLD_MS)
+    set_slot_state(slot_mask, held_mask | bit)
+
+def publish_slot_state(changed):
+    global slot_seq
+    slot_seq += 1
+    # Both retained: a new subscriber gets the current state straight from the broker
+    status = ",".join([str(i+1) for i in range(SLOT_COUNT) if not slot_mask >> i & 1]) or "FULL"
+    publish_message(TOPIC_PUB_SLOT, status, True)
+    publish_message(TOPIC_PUB_SLOT_DELTA, ujson.dumps({"seq": slot_seq, "mask": slot_mask, "changed": changed, "count": SLOT_COUNT}), True)
+
+def on_exit_sensor(pin):
+    exit_flag.set()
+
+def on_slot_sensor(pin):
+    slot_flag.set()
 
 def update_parking_slots():
-    global last_slot_check
-    current_time = time.ticks_ms()
-    
-    # Only check slots every 100ms to reduce processing
-    if time.ticks_diff(current_time, last_slot_check) >= 100:
-        last_slot_check = current_time
-        old_slots = parking_slots.copy()
-        
-        slots = [slot1_ir_sensor.value() == 0, slot2_ir_sensor.value() == 0, slot3_ir_sensor.value() == 0,
-                 slot4_ir_sensor.value() == 0, slot5_ir_sensor.value() == 0, slot6_ir_sensor.value() == 0]
-        
-        for i in range(6):
-            parking_slots[i] = slots[i]
-        
-        # Only update display if slots changed
-        if old_slots != parking_slots:
-            print("Parking slots updated:", parking_slots)
-
-def display_parking_status():
-    global last_display_update
-    current_time = time.ticks_ms()
-    
-    # Only update display every 500ms to prevent flickering
-    if time.ticks_diff(current_time, last_display_update) >= 500:
-        last_display_update = current_time
-        
+    mask = 0
+    for bank in slot_banks:
+        mask |= bank.read() << bank.offset
+    # A hold ends when its own sensor sees the car arrive, or when it runs out
+    held = held_mask & ~(mask & ~slot_mask)
+    now = time.ticks_ms()
+    for bit in list(held_until):
+        if not held & bit or time.ticks_diff(held_until[bit], now) <= 0:
+            del held_until[bit]
+            held &= ~bit
+    set_slot_state(mask, held)
+
+async def slot_task():
+    # Sensor edges wake the scan; the periodic rescan covers any edge missed while bouncing,
+    # and banks without interrupts are polled
+    interval = SLOT_RESCAN_MS if all([bank.irq for bank in slot_banks]) else SLOT_POLL_MS
+    while True:
+        try:
+            await asyncio.wait_for_ms(slot_flag.wait(), interval)
+            await asyncio.sleep_ms(SLOT_DEBOUNCE_MS)
+        except asyncio.TimeoutError:
+            pass
+        update_parking_slots()
+
+def slot_cell(i):
+    # Position of slot i within its page; rows sit on 8-pixel display pages so a change touches only its row
+    i %= SLOTS_PER_PAGE
+    return 4 + (i % DISPLAY_COLUMNS) * 40, DISPLAY_FIRST_ROW + (i // DISPLAY_COLUMNS) * 8
+
+def show_pages(first, last):
+    # Push only display pages first..last (8 pixel rows each) instead of the whole 1 KB framebuffer
+    oled.write_cmd(0x21)
+    oled.write_cmd(0)
+    oled.write_cmd(oled.width - 1)
+    oled.write_cmd(0x22)
+    oled.write_cmd(first)
+    oled.write_cmd(last)
+    oled.write_data(memoryview(oled.buffer)[first * oled.width:(last + 1) * oled.width])
+
+def title_text():
+    return "Parking System" if DISPLAY_PAGES == 1 else f"Parking {display_page + 1}/{DISPLAY_PAGES}"
+
+def show_banner(text):
+    # Rewrites only the title row; None restores the title
+    global banner
+    banner = text
+    oled.fill_rect(0, 0, oled.width, 8, 0)
+    oled.text(banner or title_text(), 5, 0)
+    show_pages(0, 0)
+
+def display_parking_status(previous):
+    # previous is the (slot_mask, held_mask) on screen now; None redraws the current page from scratch
+    first_slot = display_page * SLOTS_PER_PAGE
+    page_slots = min(SLOTS_PER_PAGE, SLOT_COUNT - first_slot)
+    if previous is None:
         oled.fill(0)
-        oled.text("Parking System", 5, 0)
-        available = get_available_slots()
-        oled.text(f"Available: {available}/6", 5, 15)
-        
-        for i in range(6):
-            status = "X" if parking_slots[i] else "O"
-            row = 25 + (i // 3) * 15
-            col = 10 + (i % 3) * 35
-            oled.text(f"S{i+1}:{status}", col, row)
-        
+        oled.text(banner or title_text(), 5, 0)
+        changed = (1 << page_slots) - 1
+        first_page, last_page = 0, oled.height // 8 - 1
+    else:
+        if previous == (slot_mask, held_mask):
+            return
+        changed = ((previous[0] ^ slot_mask) | (previous[1] ^ held_mask)) >> first_slot & ((1 << page_slots) - 1)
+        first_page, last_page = 2, 2
+
+    oled.fill_rect(0, 16, oled.width, 8, 0)
+    oled.text(f"Available: {get_available_slots()}/{SLOT_COUNT}", 5, 16)
+    for i in range(page_slots):
+        if changed >> i & 1:
+            slot = first_slot + i
+            col, row = slot_cell(slot)
+            status = "X" if slot_mask >> slot & 1 else ("A" if held_mask >> slot & 1 else "O")
+            oled.fill_rect(col, row, 40, 8, 0)
+            oled.text(f"S{slot+1}:{status}", col, row)
+            first_page, last_page = min(first_page, row // 8), max(last_page, row // 8)
+
+    if previous is None:
         oled.show()
-        
-        # Publish MQTT status
-        status = ",".join([str(i+1) for i, slot in enumerate(parking_slots) if not slot]) if available else "FULL"
-        publish_message(TOPIC_PUB_SLOT, status)
-
-# Initialize System
-oled.fill(0)
-oled.text("Parking System", 10, 20)
-oled.text("Starting...", 30, 40)
-oled.show()
-time.sleep(2)
-
-entry_state = "RED"
-entry_timer = time.ticks_ms()
-entry_gate_open = False
-
-exit_state = "RED"
-exit_timer = time.ticks_ms()
-exit_gate_open = False
-
-# Initialize WiFi and MQTT
-if connect_wifi():
-    client = connect_mqtt()
-else:
-    client = None
-
-# Set initial LED states
-set_entry_leds("RED")
-set_exit_leds("RED")
-
-print("System initialized. Starting main loop...")
-
-# Main Loop
-while True:
-    current_time = time.ticks_ms()
-
-    # MQTT handling (every loop)
-    reconnect_if_needed()
-    if mqtt_connected:
+    else:
+        show_pages(first_page, last_page)
+
+async def display_task():
+    # Redraws on slot changes; a lot bigger than one screen also flips pages every DISPLAY_PAGE_MS. The flip
+    # deadline is fixed, so a busy lot's slot changes do not keep pushing it back
+    global display_page
+    shown = None
+    next_page = time.ticks_add(time.ticks_ms(), DISPLAY_PAGE_MS)
+    while True:
+        display_parking_status(shown)
+        shown = (slot_mask, held_mask)
+        if DISPLAY_PAGES > 1:
+            remaining = time.ticks_diff(next_page, time.ticks_ms())
+            if remaining <= 0:
+                display_page = (display_page + 1) % DISPLAY_PAGES
+                shown = None
+                next_page = time.ticks_add(time.ticks_ms(), DISPLAY_PAGE_MS)
+                continue
+        else:
+            remaining = None
         try:
-            client.check_msg()
-        except Exception as e:
-            print("Error checking messages:", e)
-            mqtt_connected = False
-
-    # Update parking slots
-    update_parking_slots()
-    display_parking_status()
-
-    # Entry Gate Logic
-    if entry_state == "RED":
+            await asyncio.wait_for_ms(slots_changed.wait(), remaining)
+            slots_changed.clear()
+        except asyncio.TimeoutError:
+            pass
+
+async def heartbeat_task():
+    while True:
+        await asyncio.sleep_ms(HEARTBEAT_MS)
+        publish_message(TOPIC_PUB_HEARTBEAT, ujson.dumps({"seq": slot_seq, "mask": slot_mask, "uptime": time.ticks_ms() // 1000}))
+
+async def wait_entry_request(timeout_ms):
+    # Returns the next entry command, or None once timeout_ms passes without one
+    try:
+        await asyncio.wait_for_ms(entry_request.wait(), timeout_ms)
+    except asyncio.TimeoutError:
+        return None
+    entry_request.clear()
+    return entry_command
+
+async def entry_gate_task():
+    global entry_state, assigned_slot
+    command = None
+    while True:
+        entry_state = "RED"
         set_entry_leds("RED")
+        if command != "OPEN":
+            command = await wait_entry_request(None)
+        if command != "OPEN":
+            continue
 
-    elif entry_state == "GREEN":
+        entry_state = "GREEN"
         set_entry_leds("GREEN")
-        if not entry_gate_open:
-            entry_open_gate()
-            entry_loud_beep()
-            entry_gate_open = True
-            # Assign parking slot
-            for i in range(6):
-                if not parking_slots[i]:
-                    parking_slots[i] = True
-                    break
-        
-        # Auto close after 3 seconds
-        if time.ticks_diff(current_time, entry_timer) >= 3000:
-            entry_state = "YELLOW"
-            entry_timer = current_time
-            entry_close_gate()
-            entry_gate_open = False
-            publish_message(TOPIC_PUB_GATE_STATUS, "CLOSED")
-
-    elif entry_state == "YELLOW":
+        entry_open_gate()
+        asyncio.create_task(beep(ENTRY_BEEP))
+        # Hold the slot the central service assigned if it is still free, else the lowest free one
+        free = ~(slot_mask | held_mask) & FULL_MASK
+        if assigned_slot is not None and free >> (assigned_slot - 1) & 1:
+            print("Slot assigned:", assigned_slot)
+            show_banner(f"Go to slot {assigned_slot}")
+            hold_slot(1 << (assigned_slot - 1))
+        elif free:
+            hold_slot(free & -free)
+        assigned_slot = None
+        # Auto close after GATE_OPEN_MS; another OPEN restarts the timer, CLOSE ends it early
+        while True:
+            command = await wait_entry_request(GATE_OPEN_MS)
+            if command != "OPEN":
+                break
+        entry_close_gate()
+        publish_message(TOPIC_PUB_GATE_STATUS, "CLOSED", True)
+        if banner is not None:
+            show_banner(None)
+
+        entry_state = "YELLOW"
         set_entry_leds("YELLOW")
-        # Stay yellow for 2 seconds before going red
-        if time.ticks_diff(current_time, entry_timer) >= 2000:
-            entry_state = "RED"
-            entry_timer = current_time
+        # Stay yellow before going red; an OPEN meanwhile reopens the gate straight away
+        command = await wait_entry_request(GATE_YELLOW_MS)
 
-    # Exit Gate Logic
-    if exit_state == "RED":
+async def exit_gate_task():
+    global exit_state
+    while True:
+        exit_state = "RED"
         set_exit_leds("RED")
-        # Check for vehicle at exit
-        if exit_ir_sensor.value() == 0:
-            exit_state = "GREEN"
-            exit_timer = current_time
-
-    elif exit_state == "GREEN":
+        # Only edges seen while red count, as with the old polling loop; a car already waiting triggers at once
+        exit_flag.clear()
+        if exit_ir_sensor.value() != 0:
+            await exit_flag.wait()
+            if exit_ir_sensor.value() != 0:
+                continue
+
+        exit_state = "GREEN"
         set_exit_leds("GREEN")
-        if not exit_gate_open:
-            exit_open_gate()
-            exit_loud_beep()
-            exit_gate_open = True
-            # Free up parking slot
-            for i in range(5, -1, -1):
-                if parking_slots[i]:
-                    parking_slots[i] = False
-                    break
-        
-        # Auto close after 3 seconds
-        if time.ticks_diff(current_time, exit_timer) >= 3000:
-            exit_state = "YELLOW"
-            exit_timer = current_time
-            exit_close_gate()
-            exit_gate_open = False
-
-    elif exit_state == "YELLOW":
+        exit_open_gate()
+        asyncio.create_task(beep(EXIT_BEEP))
+        # The slot the car left is freed by its own sensor on the next scan
+        await asyncio.sleep_ms(GATE_OPEN_MS)
+        exit_close_gate()
+
+        exit_state = "YELLOW"
         set_exit_leds("YELLOW")
-        # Stay yellow for 2 seconds before going red
-        if time.ticks_diff(current_time, exit_timer) >= 2000:
-            exit_state = "RED"
-            exit_timer = current_time
+        await asyncio.sleep_ms(GATE_YELLOW_MS)
+
+async def main():
+    global client
+    # Initialize System
+    oled.fill(0)
+    oled.text("Parking System", 10, 20)
+    oled.text("Starting...", 30, 40)
+    oled.show()
+
+    # Set initial LED states
+    set_entry_leds("RED")
+    set_exit_leds("RED")
+
+    exit_ir_sensor.irq(trigger=Pin.IRQ_FALLING, handler=on_exit_sensor)
+    for bank in slot_banks:
+        if bank.irq:
+            for sensor in bank.pins:
+                sensor.irq(trigger=Pin.IRQ_FALLING | Pin.IRQ_RISING, handler=on_slot_sensor)
+    update_parking_slots()
+
+    # The gates run while WiFi and MQTT come up
+    asyncio.create_task(entry_gate_task())
+    asyncio.create_task(exit_gate_task())
+    asyncio.create_task(slot_task())
+    await asyncio.sleep(2)
+
+    # Initialize WiFi and MQTT
+    if await connect_wifi():
+        client = connect_mqtt()
+    asyncio.create_task(mqtt_task())
+    asyncio.create_task(display_task())
+    asyncio.create_task(heartbeat_task())
 
-    # Reduced loop delay
-    time.sleep(0.05)  
\ No newline at end of file
+    print("System initialized. Tasks running.")
+    while True:
+        await asyncio.sleep(60)
+
+entry_state = "RED"
+exit_state = "RED"
+asyncio.run(main())
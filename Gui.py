@@ -1,76 +1,1415 @@
 import cv2
-from time import time
+from time import time, sleep
 import numpy as np
-from ultralytics import YOLO
-from ultralytics.utils.plotting import Annotator, colors
-from datetime import datetime
-from paddleocr import PaddleOCR
-from pymongo import MongoClient
-import tkinter as tk
-from tkinter import ttk
-from PIL import Image, ImageTk
+from datetime import datetime, timezone
+try:
+    from pymongo import MongoClient
+except ImportError:
+    MongoClient = None
+try:
+    import tkinter as tk
+    from tkinter import ttk
+    import tkinter.font as tkfont
+    from PIL import Image, ImageTk
+except ImportError:
+    # Only the GUI classes need Tk; batch_process.py workers run headless without it
+    tk = ttk = tkfont = Image = ImageTk = None
 import re
-import paho.mqtt.client as mqtt
+from bisect import bisect_left
+from heapq import heappush, heappop, heapify
+try:
+    import paho.mqtt.client as mqtt
+except ImportError:
+    mqtt = None
 import threading
+import queue
+from collections import deque, Counter, OrderedDict
+import json
+import os
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Each camera gets its own tracker and entry line; role "exit" logs vehicles without opening the gate.
+# source is a device index, a video file or an RTSP URL. 'slots' maps lot slot numbers to polygons in FRAME_SIZE
+# coordinates for camera occupancy, e.g. {'name': 'level1', 'source': 1, 'role': 'slots', 'slots': {1: [(40, 60), ...]}};
+# role "slots" cameras only feed occupancy
+CAMERA_SOURCES = [
+    {'name': 'entry', 'source': 0, 'role': 'entry'}
+]
+# Local recordings to use in place of unreachable RTSP URLs, e.g. {'rtsp://10.0.0.5/stream1': 'exit_lane.mp4'}
+SOURCE_STANDINS = {}
+# Detector weights and CPU runtime: "pytorch" runs the .pt file eagerly, "onnx" (ONNX Runtime) and "openvino"
+# export it once next to the weights and load the exported model; INFERENCE_INT8 selects the quantized export
+MODEL_PATH = "yolov8m.pt"
+INFERENCE_BACKEND = "pytorch"
+INFERENCE_INT8 = False
+INFERENCE_IMGSZ = 640
+FRAME_SIZE = (1020, 500)
+# The feed is redrawn at most this often, however fast inference runs
+DISPLAY_FPS = 20
+# Detection log lines kept in memory for the sidebar; older lines are dropped
+LOG_CAPACITY = 5000
+EVENT_POLL_MS = 100
+TOAST_DURATION_MS = 2000
+TOAST_MIN_INTERVAL = 0.5
+MQTT_BROKER = "broker.hivemq.com"
+MQTT_PORT = 1883
+# (QoS, retain) by the last topic segment. Retained topics are last-known state: brokers hand them to new
+# subscribers and only the newest unsent value is kept while offline. Gate commands are never retained.
+MQTT_TOPIC_POLICY = {
+    "gate_control": (1, False),
+    "vehicle_status": (1, False),
+    "gate_status": (1, True),
+    "slot_status": (1, True),
+    "vision": (1, True),
+    "slot_assign": (1, False),
+    "occupancy": (1, True),
+    "occupancy_delta": (1, False),
+    "metrics": (0, False)
+}
+MQTT_MAX_BUFFERED = 1000
+MQTT_BACKOFF_INITIAL = 1.0
+MQTT_BACKOFF_MAX = 60.0
+MQTT_LOOP_TIMEOUT = 0.02
+OCR_WORKERS = 2
+OCR_QUEUE_SIZE = 8
+# Longest a flush waits for in-flight OCR before retiring tracks without it
+OCR_FLUSH_TIMEOUT = 30.0
+PLATE_MAX_READS = 5
+PLATE_CONFIRM_VOTES = 3
+DB_BATCH_SIZE = 50
+DB_FLUSH_INTERVAL = 2.0
+DB_RETRY_INTERVAL = 10.0
+DB_SPOOL_PATH = "detections_spool.jsonl"
+ENTRY_LINE = ((0, 350), (1020, 350))
+ENTRY_ZONE = None
+ENTRY_DEBOUNCE_FRAMES = 3
+ENTRY_COOLDOWN = 2.0
+# A slot is taken when one vehicle box covers this fraction of its polygon for SLOT_ON_FRAMES inferred frames,
+# and free again after SLOT_OFF_FRAMES without; masks are built at SLOT_MASK_SCALE of the frame size
+SLOT_COVERAGE_THRESHOLD = 0.4
+SLOT_ON_FRAMES = 5
+SLOT_OFF_FRAMES = 15
+SLOT_MASK_SCALE = 0.25
+# Camera and IR sensors must disagree this long before a slot is flagged
+SLOT_DISAGREE_SECONDS = 10.0
+# Lot slot numbers, nearest to the entry gate first; arriving cars are sent to the nearest available one
+LOT_SLOTS = list(range(1, 7))
+# An assigned slot is held for the arriving car this long unless a sensor sees it taken first
+SLOT_ASSIGN_HOLD = 120.0
+# Gate statuses logged for an arrival; REFUSED (FULL) means the service had no slot and no OPEN was sent
+GATE_OPENED = "OPENED"
+GATE_REFUSED = "REFUSED (FULL)"
+TRACK_CAPACITY = 256
+TRACK_TTL_FRAMES = 30
+TRACK_TTL_SECONDS = 10.0
+SPEED_HOMOGRAPHY = None
+METERS_PER_PIXEL = 0.05
+SPEED_WINDOW = 5
+PLATE_DETECTOR_PATH = None
+PLATE_HEIGHT = 48
+PLATE_MAX_WIDTH = 320
+PLATE_ASPECT_RANGE = (2.0, 8.0)
+PLATE_MAX_CANDIDATES = 2
+MOTION_SCALE = (160, 80)
+MOTION_PIXEL_THRESHOLD = 25
+MOTION_MIN_CHANGED = 0.002
+MOTION_HOLD_FRAMES = 30
+IDLE_INFERENCE_STRIDE = 15
+METRICS_WINDOW = 500
+METRICS_HTTP_PORT = 9108
+METRICS_PUBLISH_INTERVAL = 10.0
+
+class Metrics:
+    def __init__(self, window=METRICS_WINDOW):
+        self.window = window
+        self.samples = {}
+        self.counts = {}
+        self.counters = {}
+        self.gauges = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def timer(self, stage):
+        start = time()
+        try:
+            yield
+        finally:
+            self.observe(stage, time() - start)
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            if stage not in self.samples:
+                self.samples[stage] = deque(maxlen=self.window)
+                self.counts[stage] = 0
+            self.samples[stage].append(seconds * 1000.0)
+            self.counts[stage] += 1
+
+    def increment(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def register_gauge(self, name, read):
+        self.gauges[name] = read
+
+    def snapshot(self):
+        with self.lock:
+            samples = {stage: np.array(values) for stage, values in self.samples.items() if values}
+            counts = dict(self.counts)
+            counters = dict(self.counters)
+        stages = {}
+        for stage, values in samples.items():
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            stages[stage] = {
+                'count': counts[stage],
+                'mean_ms': round(float(values.mean()), 2),
+                'p50_ms': round(float(p50), 2),
+                'p95_ms': round(float(p95), 2),
+                'p99_ms': round(float(p99), 2)
+            }
+        gauges = {}
+        for name, read in list(self.gauges.items()):
+            try:
+                gauges[name] = read()
+            except Exception:
+                gauges[name] = None
+        return {'timestamp': time(), 'stages': stages, 'counters': counters, 'gauges': gauges}
+
+class MetricsServer:
+    def __init__(self, metrics, port=METRICS_HTTP_PORT, host="127.0.0.1"):
+        handler = type("MetricsHandler", (BaseHTTPRequestHandler,), {
+            'do_GET': lambda request: self.handle(request),
+            'log_message': lambda request, *args: None
+        })
+        self.metrics = metrics
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True)
+        self.thread.start()
+
+    def handle(self, request):
+        if request.path.rstrip("/") not in ("", "/metrics"):
+            request.send_error(404)
+            return
+        body = json.dumps(self.metrics.snapshot()).encode()
+        request.send_response(200)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class OCRWorkerPool:
+    def __init__(self, engine_factory, recognize, workers=OCR_WORKERS, max_pending=OCR_QUEUE_SIZE):
+        self.engine_factory = engine_factory
+        self.recognize = recognize
+        self.jobs = queue.Queue(maxsize=max_pending)
+        self.results = queue.Queue()
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.rejected = 0
+        # Workers whose engine came up; once none are left, jobs fail instead of waiting forever
+        self.live = workers
+        self.error = None
+        self.threads = [threading.Thread(target=self.worker_loop, name=f"ocr-{i}", daemon=True) for i in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, track_id, roi, context=None):
+        # Backpressure: one in-flight job per track and a bounded queue; rejected tracks retry on a later frame
+        with self.lock:
+            if track_id in self.pending:
+                return False
+            if not self.live:
+                self.rejected += 1
+                return False
+            try:
+                self.jobs.put_nowait((track_id, roi, context))
+            except queue.Full:
+                self.rejected += 1
+                return False
+            self.pending.add(track_id)
+            return True
+
+    def worker_loop(self):
+        try:
+            engine = self.engine_factory()
+        except Exception as e:
+            print(f"OCR engine init error: {e}")
+            with self.lock:
+                self.error = e
+                self.live -= 1
+                if not self.live:
+                    self.fail_queued()
+            return
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            track_id, roi, context = job
+            try:
+                result = self.recognize(engine, roi)
+            except Exception as e:
+                print(f"OCR worker error: {e}")
+                result = None
+            with self.lock:
+                self.pending.discard(track_id)
+            self.results.put((track_id, result, context))
+
+    def fail_queued(self):
+        # Called with the lock held; queued jobs get a None result so pending drains
+        while True:
+            try:
+                job = self.jobs.get_nowait()
+            except queue.Empty:
+                return
+            if job is not None:
+                track_id, roi, context = job
+                self.pending.discard(track_id)
+                self.results.put((track_id, None, context))
+
+    @property
+    def available(self):
+        return self.live > 0
+
+    def poll_results(self):
+        results = []
+        while True:
+            try:
+                results.append(self.results.get_nowait())
+            except queue.Empty:
+                return results
+
+    def depth(self):
+        return self.jobs.qsize()
+
+    def wait_idle(self, timeout=None, poll=0.05):
+        # True once every submitted job has a result; False on timeout or if no worker is left to finish them
+        deadline = None if timeout is None else time() + timeout
+        while True:
+            with self.lock:
+                if not self.pending:
+                    return True
+                if not self.live or not any(thread.is_alive() for thread in self.threads):
+                    return False
+            if deadline is not None and time() >= deadline:
+                return False
+            threading.Event().wait(poll)
+
+    def shutdown(self, timeout=2.0):
+        for _ in self.threads:
+            try:
+                self.jobs.put(None, timeout=timeout)
+            except queue.Full:
+                break
+        for thread in self.threads:
+            thread.join(timeout)
+
+class TrackRecord:
+    __slots__ = ('track_id', 'first_seen', 'last_seen', 'last_frame', 'speed')
+
+    def __init__(self, track_id, frame_index, now):
+        self.track_id = track_id
+        self.first_seen = now
+        self.last_seen = now
+        self.last_frame = frame_index
+        self.speed = 0.0
+
+class TrackStore:
+    def __init__(self, capacity=TRACK_CAPACITY, ttl_frames=TRACK_TTL_FRAMES, ttl_seconds=TRACK_TTL_SECONDS):
+        self.capacity = capacity
+        self.ttl_frames = ttl_frames
+        self.ttl_seconds = ttl_seconds
+        self.records = OrderedDict()
+
+    def __len__(self):
+        return len(self.records)
+
+    def get(self, track_id):
+        return self.records.get(track_id)
+
+    def touch(self, track_id, frame_index, now):
+        record = self.records.get(track_id)
+        if record is None:
+            record = TrackRecord(track_id, frame_index, now)
+            self.records[track_id] = record
+        else:
+            self.records.move_to_end(track_id)
+            record.last_seen = now
+            record.last_frame = frame_index
+        return record
+
+    def evict_stale(self, frame_index, now):
+        # Records are kept in last-seen order, so stale tracks are always at the front
+        evicted = []
+        while self.records:
+            record = next(iter(self.records.values()))
+            stale = frame_index - record.last_frame > self.ttl_frames or now - record.last_seen > self.ttl_seconds
+            if not stale and len(self.records) <= self.capacity:
+                break
+            self.records.popitem(last=False)
+            evicted.append(record.track_id)
+        return evicted
+
+    def evict_all(self):
+        evicted = list(self.records)
+        self.records.clear()
+        return evicted
+
+class SpeedEngine:
+    def __init__(self, capacity=TRACK_CAPACITY, homography=SPEED_HOMOGRAPHY, meters_per_pixel=METERS_PER_PIXEL, window=SPEED_WINDOW):
+        # homography maps frame pixels to ground-plane metres; without one, a flat metres-per-pixel scale is used
+        self.homography = np.asarray(homography, dtype=np.float64) if homography is not None else None
+        self.meters_per_pixel = meters_per_pixel
+        self.window = window
+        self.rows = {}
+        self.free_rows = []
+        self.last_point = np.zeros((0, 2))
+        self.last_time = np.zeros(0)
+        self.history = np.zeros((0, window))
+        self.history_len = np.zeros(0, dtype=np.int64)
+        self.history_pos = np.zeros(0, dtype=np.int64)
+        self.grow(capacity)
+
+    def grow(self, capacity):
+        old = len(self.last_time)
+        self.last_point = np.vstack([self.last_point, np.zeros((capacity - old, 2))])
+        self.last_time = np.concatenate([self.last_time, np.zeros(capacity - old)])
+        self.history = np.vstack([self.history, np.zeros((capacity - old, self.window))])
+        self.history_len = np.concatenate([self.history_len, np.zeros(capacity - old, dtype=np.int64)])
+        self.history_pos = np.concatenate([self.history_pos, np.zeros(capacity - old, dtype=np.int64)])
+        self.free_rows.extend(range(capacity - 1, old - 1, -1))
+
+    def allocate(self, track_ids):
+        rows = np.empty(len(track_ids), dtype=np.int64)
+        new = np.zeros(len(track_ids), dtype=bool)
+        for i, track_id in enumerate(track_ids):
+            row = self.rows.get(track_id)
+            if row is None:
+                if not self.free_rows:
+                    self.grow(2 * len(self.last_time))
+                row = self.free_rows.pop()
+                self.rows[track_id] = row
+                self.history[row] = 0
+                self.history_len[row] = 0
+                self.history_pos[row] = 0
+                new[i] = True
+            rows[i] = row
+        return rows, new
+
+    def release(self, track_id):
+        row = self.rows.pop(track_id, None)
+        if row is not None:
+            self.free_rows.append(row)
+
+    def to_ground(self, points):
+        if self.homography is None:
+            return points * self.meters_per_pixel
+        projected = np.hstack([points, np.ones((len(points), 1))]) @ self.homography.T
+        return projected[:, :2] / projected[:, 2:3]
+
+    def update(self, track_ids, boxes, now):
+        # One pass for every track in the frame: box centroids -> ground plane -> km/h, smoothed over a ring buffer
+        centroids = np.column_stack([(boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2])
+        ground = self.to_ground(centroids)
+        rows, new = self.allocate(track_ids)
+        elapsed = now - self.last_time[rows]
+        moving = ~new & (elapsed > 0)
+        measured = rows[moving]
+        if len(measured):
+            speed = np.linalg.norm(ground[moving] - self.last_point[measured], axis=1) / elapsed[moving] * 3.6
+            pos = self.history_pos[measured]
+            self.history[measured, pos] = speed
+            self.history_pos[measured] = (pos + 1) % self.window
+            self.history_len[measured] = np.minimum(self.history_len[measured] + 1, self.window)
+        self.last_point[rows] = ground
+        self.last_time[rows] = now
+        count = self.history_len[rows]
+        return np.round(self.history[rows].sum(axis=1) / np.maximum(count, 1), 2)
+
+class PlateCache:
+    def __init__(self, is_valid, max_reads=PLATE_MAX_READS, confirm_votes=PLATE_CONFIRM_VOTES):
+        self.is_valid = is_valid
+        self.max_reads = max_reads
+        self.confirm_votes = confirm_votes
+        self.tracks = {}
+
+    def mark_seen(self, track_id, context):
+        entry = self.tracks.get(track_id)
+        if entry is None:
+            entry = {'reads': [], 'plate': None, 'context': None}
+            self.tracks[track_id] = entry
+        entry['context'] = context
+
+    def needs_ocr(self, track_id):
+        entry = self.tracks.get(track_id)
+        return entry is not None and entry['plate'] is None
+
+    def plate(self, track_id):
+        entry = self.tracks.get(track_id)
+        if entry is None or not entry['reads']:
+            return None
+        return entry['plate'] or self.vote(entry['reads'])[0]
+
+    def add_read(self, track_id, text, score):
+        # Returns the plate exactly once, on the read that confirms it
+        entry = self.tracks.get(track_id)
+        if entry is None or entry['plate'] is not None or not text:
+            return None
+        entry['reads'].append((score, text))
+        entry['reads'].sort(reverse=True)
+        del entry['reads'][self.max_reads:]
+        plate, support = self.vote(entry['reads'])
+        if support >= self.confirm_votes and self.is_valid(plate):
+            entry['plate'] = plate
+            return plate
+        return None
+
+    def vote(self, reads):
+        # Per-character weighted vote across the reads that share the most common length
+        length = Counter(len(text) for _, text in reads).most_common(1)[0][0]
+        candidates = [(score, text) for score, text in reads if len(text) == length]
+        chars = []
+        support = len(candidates)
+        for i in range(length):
+            weights = Counter()
+            for score, text in candidates:
+                weights[text[i]] += score
+            char = weights.most_common(1)[0][0]
+            chars.append(char)
+            support = min(support, sum(1 for _, text in candidates if text[i] == char))
+        return ''.join(chars), support
+
+    def evict(self, track_id):
+        # A track that leaves without a confirmed plate hands back its best valid vote so it is written once
+        entry = self.tracks.pop(track_id, None)
+        if entry is None or entry['plate'] is not None or not entry['reads']:
+            return None
+        plate = self.vote(entry['reads'])[0]
+        return (plate, entry['context']) if self.is_valid(plate) else None
+
+class MongoBatchWriter:
+    def __init__(self, connect, spool_path=DB_SPOOL_PATH, batch_size=DB_BATCH_SIZE,
+                 flush_interval=DB_FLUSH_INTERVAL, retry_interval=DB_RETRY_INTERVAL, metrics=None):
+        self.connect = connect
+        self.metrics = metrics
+        self.spool_path = spool_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_interval = retry_interval
+        self.collection = None
+        self.next_retry = 0
+        self.connect_attempts = 0
+        self.spool_pending = os.path.exists(spool_path)
+        self.documents = queue.Queue()
+        self.written = 0
+        self.spooled = 0
+        self.thread = threading.Thread(target=self.run, name="mongo-writer", daemon=True)
+        self.thread.start()
+
+    @property
+    def connected(self):
+        return self.collection is not None
+
+    def submit(self, document):
+        self.documents.put(document)
+
+    def depth(self):
+        return self.documents.qsize()
+
+    def run(self):
+        # Connect (and replay any spool) straight away rather than on the first flush
+        self.flush([])
+        batch = []
+        deadline = time() + self.flush_interval
+        while True:
+            try:
+                document = self.documents.get(timeout=max(0.0, deadline - time()))
+                if document is None:
+                    self.flush(batch)
+                    return
+                batch.append(document)
+            except queue.Empty:
+                pass
+            if len(batch) >= self.batch_size or time() >= deadline:
+                self.flush(batch)
+                batch = []
+                deadline = time() + self.flush_interval
+
+    def flush(self, batch):
+        if self.collection is None and time() >= self.next_retry:
+            self.connect_attempts += 1
+            self.collection = self.connect()
+            if self.collection is None:
+                self.next_retry = time() + self.retry_interval
+        if self.collection is not None and self.replay_spool():
+            inserted = self.insert(batch)
+            if inserted == len(batch):
+                return
+            batch = batch[inserted:]
+        if batch:
+            self.spool(batch)
+
+    def insert(self, documents):
+        if not documents:
+            return 0
+        try:
+            start = time()
+            self.collection.insert_many(documents)
+            if self.metrics is not None:
+                self.metrics.observe("db_write", time() - start)
+            self.written += len(documents)
+            return len(documents)
+        except Exception as e:
+            print(f"Database write error: {e}")
+            self.collection = None
+            self.next_retry = time() + self.retry_interval
+            inserted = (getattr(e, 'details', None) or {}).get('nInserted', 0)
+            self.written += inserted
+            return inserted
+
+    def spool(self, documents):
+        try:
+            with open(self.spool_path, "a") as spool:
+                for document in documents:
+                    document.pop('_id', None)
+                    spool.write(json.dumps(document, default=str) + "\n")
+            self.spooled += len(documents)
+            self.spool_pending = True
+        except OSError as e:
+            print(f"Database spool error, {len(documents)} records lost: {e}")
+
+    def replay_spool(self):
+        if not self.spool_pending:
+            return True
+        documents = []
+        with open(self.spool_path) as spool:
+            for line in spool:
+                try:
+                    documents.append(json.loads(line))
+                except ValueError:
+                    pass
+        for start in range(0, len(documents), self.batch_size):
+            chunk = documents[start:start + self.batch_size]
+            inserted = self.insert(chunk)
+            if inserted < len(chunk):
+                remaining = documents[start + inserted:]
+                os.remove(self.spool_path)
+                self.spool(remaining)
+                self.spooled -= len(remaining)
+                return False
+        os.remove(self.spool_path)
+        self.spool_pending = False
+        print(f"Replayed {len(documents)} spooled records to MongoDB")
+        return True
+
+    def shutdown(self, timeout=5.0):
+        self.documents.put(None)
+        self.thread.join(timeout)
+
+class MQTTPublisher:
+    def __init__(self, client_factory, host=MQTT_BROKER, port=MQTT_PORT, subscriptions=(), on_message=None,
+                 topic_policy=MQTT_TOPIC_POLICY, max_buffered=MQTT_MAX_BUFFERED, backoff_initial=MQTT_BACKOFF_INITIAL,
+                 backoff_max=MQTT_BACKOFF_MAX, keepalive=60, metrics=None):
+        # The worker thread owns the client: it connects, drives client.loop() and does every publish, so a slow or
+        # unreachable broker only ever delays this thread. publish() just enqueues and is safe from any thread.
+        self.client_factory = client_factory
+        self.host = host
+        self.port = port
+        self.subscriptions = list(subscriptions)
+        self.on_message = on_message
+        self.topic_policy = topic_policy
+        self.keepalive = keepalive
+        self.metrics = metrics
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.failures = 0
+        self.next_attempt = 0
+        self.client = None
+        self.connected = False
+        self.status = "Connecting"
+        self.outbound = deque(maxlen=max_buffered)
+        self.state = OrderedDict()
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopping = False
+        self.published = 0
+        self.dropped = 0
+        self.thread = threading.Thread(target=self.run, name="mqtt-publisher", daemon=True)
+        self.thread.start()
+
+    def policy(self, topic):
+        return self.topic_policy.get(topic.rsplit("/", 1)[-1], (0, False))
+
+    def publish(self, topic, payload, qos=None, retain=None):
+        default_qos, default_retain = self.policy(topic)
+        qos = default_qos if qos is None else qos
+        retain = default_retain if retain is None else retain
+        with self.lock:
+            if retain:
+                # Retained topics carry last-known state, so a newer value replaces any unsent one
+                self.state.pop(topic, None)
+                self.state[topic] = (payload, qos, time())
+            else:
+                if len(self.outbound) == self.outbound.maxlen:
+                    self.dropped += 1
+                self.outbound.append((topic, payload, qos, False, time()))
+        self.wake.set()
+        return True
+
+    def depth(self):
+        with self.lock:
+            return len(self.outbound) + len(self.state)
+
+    def next_message(self):
+        with self.lock:
+            if self.state:
+                topic, (payload, qos, queued_at) = self.state.popitem(last=False)
+                return topic, payload, qos, True, queued_at
+            if self.outbound:
+                return self.outbound.popleft()
+        return None
+
+    def requeue(self, message):
+        topic, payload, qos, retain, queued_at = message
+        with self.lock:
+            if retain:
+                if topic not in self.state:
+                    self.state[topic] = (payload, qos, queued_at)
+                    self.state.move_to_end(topic, last=False)
+            else:
+                self.outbound.appendleft(message)
+
+    def run(self):
+        while not self.stopping:
+            if self.client is None or (not self.connected and self.status != "Connecting"):
+                wait = self.next_attempt - time()
+                if wait > 0:
+                    self.wake.wait(min(wait, 1.0))
+                    self.wake.clear()
+                else:
+                    self.connect()
+                continue
+            self.flush()
+            try:
+                rc = self.client.loop(timeout=MQTT_LOOP_TIMEOUT)
+            except Exception as e:
+                print(f"MQTT loop error: {e}")
+                rc = -1
+            # on_disconnect may already have handled the drop inside loop()
+            if rc != 0 and (self.connected or self.status == "Connecting"):
+                self.connection_lost(rc)
+
+    def connect(self):
+        try:
+            if self.client is None:
+                self.client = self.client_factory()
+                self.client.on_connect = self.on_connect
+                self.client.on_disconnect = self.on_disconnect
+                self.client.on_message = self.handle_message
+            self.status = "Connecting"
+            self.client.connect(self.host, self.port, self.keepalive)
+        except Exception as e:
+            print(f"MQTT connect error: {e}")
+            self.connection_lost(str(e)[:20])
+
+    def connection_lost(self, reason):
+        # Exponential backoff with jitter so a broker outage doesn't turn into a reconnect storm
+        self.connected = False
+        delay = min(self.backoff_max, self.backoff_initial * 2 ** self.failures) * (0.5 + np.random.random() / 2)
+        self.failures += 1
+        self.next_attempt = time() + delay
+        self.status = f"Retry in {delay:.0f}s"
+        print(f"MQTT connection lost ({reason}), retrying in {delay:.1f}s")
+        if self.metrics is not None:
+            self.metrics.increment("mqtt_reconnects")
+
+    def on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            self.connection_lost(f"rc {rc}")
+            return
+        self.connected = True
+        self.failures = 0
+        self.status = "Connected"
+        for topic in self.subscriptions:
+            client.subscribe(topic, self.policy(topic)[0])
+            print(f"Subscribed to: {topic}")
+
+    def on_disconnect(self, client, userdata, rc):
+        if self.stopping:
+            self.connected = False
+            self.status = "Disconnected"
+        elif self.connected or self.status == "Connecting":
+            self.connection_lost(rc)
+
+    def handle_message(self, client, userdata, msg):
+        if self.on_message is not None:
+            self.on_message(client, userdata, msg)
+
+    def flush(self):
+        while self.connected:
+            message = self.next_message()
+            if message is None:
+                return
+            topic, payload, qos, retain, queued_at = message
+            start = time()
+            try:
+                rc = self.client.publish(topic, payload, qos=qos, retain=retain).rc
+            except Exception as e:
+                print(f"MQTT publish error: {e}")
+                rc = -1
+            if rc != 0:
+                self.requeue(message)
+                self.connection_lost(rc)
+                return
+            self.published += 1
+            if self.metrics is not None:
+                # mqtt_send is the client call alone; mqtt_delivery runs from publish() and so includes
+                # queueing while the broker is slow or away
+                self.metrics.observe("mqtt_send", time() - start)
+                self.metrics.observe("mqtt_delivery", time() - queued_at)
+
+    def wait_idle(self, timeout=2.0):
+        deadline = time() + timeout
+        while self.depth() and self.connected and time() < deadline:
+            self.wake.set()
+            sleep(0.01)
+        return not self.depth()
+
+    def shutdown(self, timeout=2.0):
+        self.wait_idle(timeout)
+        self.stopping = True
+        self.wake.set()
+        self.thread.join(timeout)
+        if self.client is not None:
+            try:
+                self.client.disconnect()
+            except Exception:
+                pass
+
+class EntryEventTracker:
+    def __init__(self, line=ENTRY_LINE, zone=ENTRY_ZONE, debounce_frames=ENTRY_DEBOUNCE_FRAMES, cooldown=ENTRY_COOLDOWN):
+        # The entry side is the half-plane left of line[0] -> line[1] (below it for the default line),
+        # or the inside of zone when a polygon is configured
+        self.line = line
+        self.zone = np.array(zone, dtype=np.float32) if zone is not None else None
+        self.debounce_frames = debounce_frames
+        self.cooldown = cooldown
+        self.last_event = float('-inf')
+        self.tracks = {}
+
+    def is_inside(self, point):
+        if self.zone is not None:
+            return cv2.pointPolygonTest(self.zone, (float(point[0]), float(point[1])), False) >= 0
+        (lx1, ly1), (lx2, ly2) = self.line
+        return (lx2 - lx1) * (point[1] - ly1) - (ly2 - ly1) * (point[0] - lx1) > 0
+
+    def update(self, track_id, point, now):
+        # Returns True exactly once per track: after it has stayed on the entry side for debounce_frames
+        # consecutive frames and no other arrival fired within the cooldown
+        entry = self.tracks.get(track_id)
+        if entry is None:
+            entry = {'inside_frames': 0, 'arrival': None}
+            self.tracks[track_id] = entry
+        if entry['arrival'] is not None:
+            return False
+        entry['inside_frames'] = entry['inside_frames'] + 1 if self.is_inside(point) else 0
+        if entry['inside_frames'] < self.debounce_frames or now - self.last_event < self.cooldown:
+            return False
+        self.last_event = now
+        return True
+
+    def set_arrival(self, track_id, arrival):
+        self.tracks[track_id]['arrival'] = arrival
+
+    def arrival(self, track_id):
+        entry = self.tracks.get(track_id)
+        return entry['arrival'] if entry is not None else None
+
+    def forget(self, track_id):
+        self.tracks.pop(track_id, None)
+
+    def draw(self, im0):
+        if self.zone is not None:
+            cv2.polylines(im0, [self.zone.astype(np.int32)], True, (255, 255, 0), 2)
+        else:
+            cv2.line(im0, tuple(map(int, self.line[0])), tuple(map(int, self.line[1])), (255, 255, 0), 2)
+
+class SlotOccupancy:
+    def __init__(self, polygons, frame_size=FRAME_SIZE, threshold=SLOT_COVERAGE_THRESHOLD, on_frames=SLOT_ON_FRAMES,
+                 off_frames=SLOT_OFF_FRAMES, scale=SLOT_MASK_SCALE):
+        # Each slot polygon is rasterised once into a summed-area table over its bounding box, all packed into one
+        # flat array: the area of any box inside any slot is then four lookups, so a frame costs slots x boxes
+        # lookups with no per-pixel work, and memory stays around one frame's worth for non-overlapping slots
+        self.slots = np.array(sorted(polygons), dtype=int)
+        self.polygons = [np.array(polygons[slot], dtype=np.int32) for slot in self.slots]
+        self.scale = scale
+        frame_width, frame_height = int(round(frame_size[0] * scale)), int(round(frame_size[1] * scale))
+        rects, tables = [], []
+        for polygon in self.polygons:
+            scaled = np.round(polygon * scale).astype(np.int32)
+            x, y, width, height = cv2.boundingRect(scaled)
+            x, y = max(x, 0), max(y, 0)
+            width, height = max(min(width, frame_width - x), 1), max(min(height, frame_height - y), 1)
+            mask = np.zeros((height, width), dtype=np.uint8)
+            cv2.fillPoly(mask, [scaled - (x, y)], 1)
+            tables.append(cv2.integral(mask).ravel())
+            rects.append((x, y, width, height))
+        rects = np.array(rects, dtype=np.int64).reshape(-1, 4)
+        self.origin_x, self.origin_y = rects[:, 0:1], rects[:, 1:2]
+        self.width, self.height = rects[:, 2:3], rects[:, 3:4]
+        self.stride = self.width + 1
+        self.offsets = np.cumsum([0] + [len(table) for table in tables[:-1]])[:, None]
+        self.tables = np.concatenate(tables) if tables else np.zeros(1, dtype=np.int32)
+        self.areas = np.maximum(np.array([table[-1] for table in tables], dtype=np.float32), 1)
+        self.threshold = threshold
+        self.on_frames = on_frames
+        self.off_frames = off_frames
+        self.occupied = np.zeros(len(self.slots), dtype=bool)
+        self.streak = np.zeros(len(self.slots), dtype=np.int32)
+        self.primed = False
+
+    def coverage(self, boxes):
+        # Largest fraction of each slot covered by a single box; corners are clipped into every slot's rect at once,
+        # giving slots x boxes arrays
+        if boxes is None or not len(boxes):
+            return np.zeros(len(self.slots), dtype=np.float32)
+        scaled = np.asarray(boxes, dtype=np.float32)[:, :4] * self.scale
+        x1 = np.clip(np.floor(scaled[:, 0]).astype(np.int64) - self.origin_x, 0, self.width)
+        x2 = np.clip(np.ceil(scaled[:, 2]).astype(np.int64) - self.origin_x, 0, self.width)
+        row1 = self.offsets + np.clip(np.floor(scaled[:, 1]).astype(np.int64) - self.origin_y, 0, self.height) * self.stride
+        row2 = self.offsets + np.clip(np.ceil(scaled[:, 3]).astype(np.int64) - self.origin_y, 0, self.height) * self.stride
+        tables = self.tables
+        inside = tables[row2 + x2] - tables[row2 + x1] - tables[row1 + x2] + tables[row1 + x1]
+        return (inside / self.areas[:, None]).max(axis=1)
+
+    def update(self, boxes):
+        # Returns [(slot, occupied)] for slots whose state flipped; the first frame sets every slot
+        raw = self.coverage(boxes) >= self.threshold
+        if not self.primed:
+            self.primed = True
+            self.occupied = raw
+            return [(int(slot), bool(state)) for slot, state in zip(self.slots, raw)]
+        pending = raw != self.occupied
+        self.streak = np.where(pending, self.streak + 1, 0)
+        flip = pending & (self.streak >= np.where(raw, self.on_frames, self.off_frames))
+        if not flip.any():
+            return []
+        self.occupied = self.occupied ^ flip
+        self.streak[flip] = 0
+        return [(int(slot), bool(state)) for slot, state in zip(self.slots[flip], self.occupied[flip])]
+
+    def draw(self, im0, flagged=()):
+        taken = [polygon for polygon, state in zip(self.polygons, self.occupied) if state]
+        free = [polygon for polygon, state in zip(self.polygons, self.occupied) if not state]
+        if taken:
+            cv2.polylines(im0, taken, True, (0, 0, 255), 2)
+        if free:
+            cv2.polylines(im0, free, True, (0, 255, 0), 2)
+        for slot, polygon in zip(self.slots, self.polygons):
+            x, y = polygon.min(axis=0)
+            cv2.putText(im0, f"{'!' if slot in flagged else ''}{slot}", (int(x) + 3, int(y) + 15),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 165, 255) if slot in flagged else (255, 255, 255), 1)
+
+class OccupancyService:
+    # Slot states in deltas and snapshots
+    FREE, OCCUPIED, RESERVED, ASSIGNED = "F", "O", "R", "A"
+
+    def __init__(self, slots=LOT_SLOTS, publish=None, assign_hold=SLOT_ASSIGN_HOLD):
+        # Authoritative lot state. Each sensor source (IR, camera) reports per slot and a slot is occupied while any
+        # source says so; reserved and just-assigned slots are held back from allocation. Counts are maintained
+        # as slots change, the nearest available slot comes from a lazily pruned heap, and every batch of changes
+        # is handed to publish as a compact delta
+        self.slots = []
+        self.rank = {}
+        self.readings = {}
+        self.masks = {}
+        self.occupied = set()
+        self.reservations = {}
+        # Active reservations that have not started yet; they move into reservations when their start fires
+        self.upcoming = {}
+        self.assigned = {}
+        self.expiries = []
+        self.free_heap = []
+        self.available = 0
+        self.pending = {}
+        self.seq = 0
+        self.known = False
+        self.publish = publish
+        self.assign_hold = assign_hold
+        self.lock = threading.RLock()
+        for slot in slots:
+            self.add_slot(slot)
+
+    def add_slot(self, slot):
+        self.rank[slot] = len(self.slots)
+        self.slots.append(slot)
+        self.available += 1
+        heappush(self.free_heap, (self.rank[slot], slot))
+
+    def is_available(self, slot):
+        return slot not in self.occupied and slot not in self.reservations and slot not in self.assigned
+
+    def state(self, slot):
+        if slot in self.occupied:
+            return self.OCCUPIED
+        if slot in self.assigned:
+            return self.ASSIGNED
+        if slot in self.reservations:
+            return self.RESERVED
+        return self.FREE
+
+    def begin(self, slot):
+        if slot not in self.rank:
+            self.add_slot(slot)
+        return self.is_available(slot), self.state(slot)
+
+    def commit(self, slot, before):
+        was_available, old_state = before
+        available = self.is_available(slot)
+        if available != was_available:
+            self.available += 1 if available else -1
+            if available:
+                heappush(self.free_heap, (self.rank[slot], slot))
+                if len(self.free_heap) > 4 * len(self.slots):
+                    # Stale entries pile up when slots behind the nearest one keep flipping
+                    self.free_heap = [(self.rank[slot], slot) for slot in self.slots if self.is_available(slot)]
+                    heapify(self.free_heap)
+        new_state = self.state(slot)
+        if new_state != old_state:
+            self.pending[slot] = new_state
+
+    def flush(self):
+        if not self.pending:
+            return None
+        self.seq += 1
+        delta = {'seq': self.seq, 'free': self.available, 'slots': {str(slot): state for slot, state in self.pending.items()}}
+        self.pending = {}
+        if self.publish is not None:
+            self.publish(delta)
+        return delta
+
+    def expire(self, now):
+        while self.expiries and self.expiries[0][0] <= now:
+            when, kind, slot = heappop(self.expiries)
+            if kind == "assign" and self.assigned.get(slot) == when:
+                before = self.begin(slot)
+                del self.assigned[slot]
+                self.commit(slot, before)
+            elif kind == "reservation_start" and slot in self.upcoming and self.upcoming[slot]['start'] == when:
+                before = self.begin(slot)
+                self.reservations[slot] = self.upcoming.pop(slot)
+                self.commit(slot, before)
+            elif kind == "reservation" and slot in self.reservations and self.reservations[slot]['end'] == when:
+                before = self.begin(slot)
+                del self.reservations[slot]
+                self.commit(slot, before)
+
+    def update(self, source, changes, now=None):
+        # changes: [(slot, occupied)] from one source; only the slots listed are touched
+        with self.lock:
+            self.expire(time() if now is None else now)
+            reading = self.readings.setdefault(source, set())
+            for slot, occupied in changes:
+                before = self.begin(slot)
+                if occupied:
+                    reading.add(slot)
+                    self.occupied.add(slot)
+                    # Whoever was sent here has arrived, or someone else took it
+                    self.assigned.pop(slot, None)
+                else:
+                    reading.discard(slot)
+                    if not any(slot in other for other in self.readings.values()):
+                        self.occupied.discard(slot)
+                self.commit(slot, before)
+            self.known = True
+            return self.flush()
+
+    def update_mask(self, source, mask, now=None):
+        # Bit i is slot i+1, as published by the ESP32; only bits that changed since the last mask are applied
+        with self.lock:
+            changed = mask ^ self.masks.get(source, 0)
+            self.masks[source] = mask
+            changes = []
+            while changed:
+                bit = (changed & -changed).bit_length() - 1
+                changes.append((bit + 1, bool(mask >> bit & 1)))
+                changed &= changed - 1
+            return self.update(source, changes, now)
+
+    def apply_reservation(self, record, now=None):
+        # record follows the reservations collection: slot_id, reservation_time (ISO 8601), duration (minutes), status
+        with self.lock:
+            now = time() if now is None else now
+            self.expire(now)
+            slot = int(record['slot_id'])
+            start = record.get('reservation_time')
+            if isinstance(start, str):
+                start = datetime.fromisoformat(start.replace("Z", "+00:00"))
+            if start and start.tzinfo is None:
+                # pymongo hands back naive datetimes in UTC
+                start = start.replace(tzinfo=timezone.utc)
+            start = start.timestamp() if start else now
+            end = start + float(record.get('duration', 0)) * 60
+            before = self.begin(slot)
+            self.reservations.pop(slot, None)
+            self.upcoming.pop(slot, None)
+            if record.get('status') == "active" and end > now:
+                # The slot is only held from start until end
+                reservation = dict(record, start=start, end=end)
+                if start > now:
+                    self.upcoming[slot] = reservation
+                    heappush(self.expiries, (start, "reservation_start", slot))
+                else:
+                    self.reservations[slot] = reservation
+                heappush(self.expiries, (end, "reservation", slot))
+            self.commit(slot, before)
+            return self.flush()
+
+    def load_reservations(self, records, now=None):
+        for record in records:
+            try:
+                self.apply_reservation(record, now)
+            except (KeyError, TypeError, ValueError) as err:
+                print(f"Skipping reservation {record.get('_id', '')}: {err}")
+
+    def nearest_available(self):
+        while self.free_heap:
+            rank, slot = self.free_heap[0]
+            if self.is_available(slot):
+                return slot
+            heappop(self.free_heap)
+        return None
+
+    def assign(self, now=None):
+        # Holds the nearest available slot for an arriving car; None when nothing is available
+        with self.lock:
+            now = time() if now is None else now
+            self.expire(now)
+            slot = self.nearest_available()
+            if slot is None:
+                return None
+            before = self.begin(slot)
+            self.assigned[slot] = now + self.assign_hold
+            heappush(self.expiries, (now + self.assign_hold, "assign", slot))
+            self.commit(slot, before)
+            self.flush()
+            return slot
+
+    def is_reserved(self, slot, now=None):
+        reservation = self.reservations.get(slot)
+        return reservation is not None and reservation['end'] > (time() if now is None else now)
+
+    def counts(self, now=None):
+        with self.lock:
+            self.expire(time() if now is None else now)
+            self.flush()
+            return {'slots': len(self.slots), 'occupied': len(self.occupied), 'reserved': len(self.reservations),
+                    'assigned': len(self.assigned), 'available': self.available}
+
+    def snapshot(self):
+        with self.lock:
+            return {'seq': self.seq, 'free': self.available, 'slots': {str(slot): self.state(slot) for slot in self.slots}}
+
+class PlateLocalizer:
+    def __init__(self, detector_path=PLATE_DETECTOR_PATH, max_candidates=PLATE_MAX_CANDIDATES):
+        # A dedicated plate detector is used when weights are configured, otherwise contour/aspect-ratio heuristics
+        if detector_path:
+            from ultralytics import YOLO
+            self.detector = YOLO(detector_path)
+        else:
+            self.detector = None
+        self.max_candidates = max_candidates
+        self.text_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (13, 5))
+        self.square_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+
+    def locate(self, roi):
+        if roi is None or roi.size == 0:
+            return []
+        boxes = self.detect_boxes(roi) if self.detector is not None else self.heuristic_boxes(roi)
+        return [self.normalize(roi[y1:y2, x1:x2]) for x1, y1, x2, y2 in boxes[:self.max_candidates]]
+
+    def detect_boxes(self, roi):
+        results = self.detector.predict(roi, conf=0.25, verbose=False)
+        if not len(results[0].boxes):
+            return []
+        order = np.argsort(-results[0].boxes.conf.cpu().numpy())
+        return [tuple(map(int, box)) for box in results[0].boxes.xyxy.cpu().numpy()[order]]
+
+    def heuristic_boxes(self, roi):
+        # Plate characters are dark strokes on a light background: black-hat, horizontal gradient, then close
+        # into text-line blobs and keep wide ones, preferring the lower part of the vehicle
+        height, width = roi.shape[:2]
+        gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
+        blackhat = cv2.morphologyEx(gray, cv2.MORPH_BLACKHAT, self.text_kernel)
+        light = cv2.morphologyEx(gray, cv2.MORPH_CLOSE, self.square_kernel)
+        _, light = cv2.threshold(light, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        gradient = np.absolute(cv2.Sobel(blackhat, cv2.CV_32F, 1, 0, ksize=-1))
+        gradient = cv2.normalize(gradient, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+        gradient = cv2.morphologyEx(cv2.GaussianBlur(gradient, (5, 5), 0), cv2.MORPH_CLOSE, self.text_kernel)
+        _, mask = cv2.threshold(gradient, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        mask = cv2.dilate(cv2.erode(mask, None, iterations=2), None, iterations=2)
+        mask = cv2.bitwise_and(mask, mask, mask=light)
+        mask = cv2.erode(cv2.dilate(mask, None, iterations=2), None, iterations=1)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        candidates = []
+        for contour in contours:
+            x, y, w, h = cv2.boundingRect(contour)
+            area = w * h / float(width * height)
+            if h < 6 or not (PLATE_ASPECT_RANGE[0] <= w / float(h) <= PLATE_ASPECT_RANGE[1]) or not (0.002 <= area <= 0.3):
+                continue
+            score = area + (y + h / 2.0) / height
+            pad_x, pad_y = int(w * 0.1), int(h * 0.35)
+            candidates.append((score, (max(0, x - pad_x), max(0, y - pad_y), min(width, x + w + pad_x), min(height, y + h + pad_y))))
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        return [box for _, box in candidates]
+
+    def normalize(self, plate):
+        height, width = plate.shape[:2]
+        target_width = min(PLATE_MAX_WIDTH, max(1, int(round(width * PLATE_HEIGHT / float(height)))))
+        interpolation = cv2.INTER_AREA if height > PLATE_HEIGHT else cv2.INTER_CUBIC
+        return cv2.resize(plate, (target_width, PLATE_HEIGHT), interpolation=interpolation)
+
+# ultralytics (torch) and paddleocr take seconds to import, so they are imported where first needed,
+# which lets the GUI come up before the models load in the background
+def create_tracker(frame_rate=30):
+    from ultralytics.trackers.byte_tracker import BYTETracker
+    from ultralytics.utils import IterableSimpleNamespace, yaml_load
+    from ultralytics.utils.checks import check_yaml
+    return BYTETracker(IterableSimpleNamespace(**yaml_load(check_yaml("bytetrack.yaml"))), frame_rate=frame_rate)
+
+def open_source(source):
+    # Returns (capture, frame_interval); recorded files are paced at their own FPS and looped like a live feed
+    source = SOURCE_STANDINS.get(source, source)
+    if isinstance(source, str) and source.isdigit():
+        source = int(source)
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        cap.release()
+        return None
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    if isinstance(source, str) and os.path.isfile(source):
+        return cap, 1.0 / (cap.get(cv2.CAP_PROP_FPS) or 25.0)
+    return cap, 0.0
+
+def exported_model_path(model_path, backend, int8=False, imgsz=INFERENCE_IMGSZ):
+    # "_dyn" keeps older fixed batch-1 exports from being picked up
+    stem = os.path.splitext(model_path)[0] + ("_int8" if int8 else "") + f"_{imgsz}_dyn"
+    if backend == "onnx":
+        return stem + ".onnx"
+    if backend == "openvino":
+        return stem + "_openvino_model"
+    raise ValueError(f"Unknown inference backend: {backend}")
+
+def export_model(model_path, backend, int8=False, imgsz=INFERENCE_IMGSZ):
+    target = exported_model_path(model_path, backend, int8, imgsz)
+    if os.path.exists(target):
+        return target
+    from ultralytics import YOLO
+    model = YOLO(model_path)
+    # Dynamic batch so estimate_batch can send every camera's frame through one run
+    if backend == "onnx":
+        exported = model.export(format="onnx", imgsz=imgsz, simplify=True, dynamic=True)
+        if int8:
+            # Ultralytics has no INT8 ONNX export, so quantize the FP32 graph's weights with ONNX Runtime
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            quantize_dynamic(exported, target, weight_type=QuantType.QUInt8)
+            os.remove(exported)
+            return target
+    else:
+        # OpenVINO INT8 uses NNCF post-training quantization calibrated on the coco8 sample set
+        exported = model.export(format="openvino", imgsz=imgsz, int8=int8, dynamic=True)
+    os.replace(exported, target)
+    return target
+
+def load_detector(model_path=MODEL_PATH, backend=INFERENCE_BACKEND, int8=INFERENCE_INT8, imgsz=INFERENCE_IMGSZ):
+    from ultralytics import YOLO
+    if backend == "pytorch":
+        return YOLO(model_path)
+    return YOLO(export_model(model_path, backend, int8, imgsz), task="detect")
+
+class StreamState:
+    def __init__(self, name, is_valid_plate, role="entry", entry_line=ENTRY_LINE, entry_zone=ENTRY_ZONE, slots=None):
+        self.name = name
+        self.role = role
+        self.slot_occupancy = SlotOccupancy(slots) if slots else None
+        self.tracks = TrackStore()
+        self.speed_engine = SpeedEngine()
+        self.plate_cache = PlateCache(is_valid_plate)
+        self.entry_events = EntryEventTracker(line=entry_line, zone=entry_zone)
+        self.frame_index = 0
+        self.tracker = None
 
 class SpeedEstimator:
-    def __init__(self):
-        self.model = YOLO("yolov8m.pt")
-        self.spd = {}
-        self.trk_pt = {}
-        self.trk_pp = {}
-        self.logged_ids = set()
-        self.new_detections = []
-        self.ocr = PaddleOCR(use_angle_cls=True, lang='en')
-        self.db_connection = self.connect_to_db()
-        self.db_connected = self.db_connection is not None
+    def __init__(self, model_path=MODEL_PATH, enable_mqtt=True, enable_db=True, ocr_workers=OCR_WORKERS, streams=None,
+                 backend=INFERENCE_BACKEND, int8=INFERENCE_INT8, imgsz=INFERENCE_IMGSZ, lazy=False):
+        # With lazy=True the detector loads and warms up on a background thread; until readiness["Detector"]
+        # is "Ready" self.model is None and callers must not run inference
+        self.model = None
+        self.imgsz = imgsz
+        self.metrics = Metrics()
+        self.readiness = {"Detector": "Loading", "OCR": "Loading"}
+        self.new_detections = deque()
+        self.ocr_workers = ocr_workers
+        self.ocr_ready = 0
+        self.ocr_lock = threading.Lock()
+        self.ocr_pool = OCRWorkerPool(self.create_ocr_engine, self.recognize_plate, workers=ocr_workers)
+        # Created before the DB writer, whose connection loads active reservations into it; publishing is attached
+        # once the MQTT client exists
+        self.occupancy = OccupancyService()
+        self.db_writer = MongoBatchWriter(self.connect_to_db, metrics=self.metrics) if enable_db else None
         self.car_pattern = re.compile(r'^[A-Z]{2}\d{2}[A-Z]{2}\d{4}$')
         self.bike_pattern = re.compile(r'^[A-Z]{2}\d{2}[A-Z]{1,2}\d{4}$')
-        self.mqtt_client = self.setup_mqtt()
+        self.streams = {}
+        for config in streams or CAMERA_SOURCES[:1]:
+            self.add_stream(config['name'], role=config.get('role', 'entry'), entry_line=config.get('entry_line', ENTRY_LINE),
+                            entry_zone=config.get('entry_zone', ENTRY_ZONE), slots=config.get('slots'))
+        self.default_stream = next(iter(self.streams.values()))
+        self.enable_mqtt = enable_mqtt
         self.TOPIC_PREFIX = "parking_system_custom_123456/"
         self.TOPIC_SUB_GATE = self.TOPIC_PREFIX + "gate_control"
         self.TOPIC_SUB_GATE_STATUS = self.TOPIC_PREFIX + "gate_status"
         self.TOPIC_PUB_VEHICLE = self.TOPIC_PREFIX + "vehicle_status"
-        self.mqtt_status = "Disconnected"
+        self.TOPIC_PUB_METRICS = self.TOPIC_PREFIX + "metrics"
+        self.TOPIC_PUB_SLOT_VISION = self.TOPIC_PREFIX + "slot_status/vision"
+        self.TOPIC_SUB_SLOT_DELTA = self.TOPIC_PREFIX + "slot_delta"
+        self.TOPIC_SUB_RESERVATIONS = self.TOPIC_PREFIX + "reservations"
+        self.TOPIC_PUB_ASSIGN = self.TOPIC_PREFIX + "slot_assign"
+        self.TOPIC_PUB_OCCUPANCY = self.TOPIC_PREFIX + "occupancy"
+        self.TOPIC_PUB_OCCUPANCY_DELTA = self.TOPIC_PREFIX + "occupancy_delta"
+        # Camera occupancy across every slots-configured stream, and the ESP32's IR view for cross-checking
+        self.vision_slots = {}
+        self.ir_slot_mask = None
+        # Slots 1..ir_slot_count have IR sensors; camera slots beyond that are not cross-checked
+        self.ir_slot_count = 0
+        self.ir_changed = False
+        self.slot_disagreements = {}
+        self.flagged_slots = set()
+        self.mqtt_client = self.setup_mqtt() if enable_mqtt else None
+        if self.mqtt_client is not None:
+            with self.occupancy.lock:
+                self.occupancy.publish = self.publish_occupancy
+                # Covers whatever the DB writer loaded before there was anyone to publish it
+                self.mqtt_client.publish(self.TOPIC_PUB_OCCUPANCY, json.dumps(self.occupancy.snapshot(), separators=(',', ':')))
         self.gui_callback = None
         self.gate_status = "Unknown"
         self.detection_counter = 0
+        self.metrics.register_gauge("ocr_queue", self.ocr_pool.depth)
+        self.metrics.register_gauge("ocr_rejected", lambda: self.ocr_pool.rejected)
+        self.metrics.register_gauge("live_tracks", lambda: sum(len(stream.tracks) for stream in self.streams.values()))
+        if self.vision_enabled:
+            self.metrics.register_gauge("vision_occupied", lambda: sum(self.vision_slots.values()))
+            self.metrics.register_gauge("slot_disagreements", lambda: len(self.flagged_slots))
+        self.metrics.register_gauge("slots_available", lambda: self.occupancy.available)
+        if self.mqtt_client is not None:
+            self.metrics.register_gauge("mqtt_queue", self.mqtt_client.depth)
+            self.metrics.register_gauge("mqtt_dropped", lambda: self.mqtt_client.dropped)
+        if self.db_writer is not None:
+            self.metrics.register_gauge("db_queue", self.db_writer.depth)
+            self.metrics.register_gauge("db_spooled", lambda: self.db_writer.spooled)
+        if lazy:
+            threading.Thread(target=self.load_model_background, args=(model_path, backend, int8), name="model-loader", daemon=True).start()
+        else:
+            self.load_model(model_path, backend, int8)
+
+    def load_model(self, model_path, backend, int8):
+        self.readiness["Detector"] = "Loading"
+        model = load_detector(model_path, backend, int8, self.imgsz)
+        self.readiness["Detector"] = "Warming up"
+        with self.metrics.timer("warmup"):
+            self.warm_up(model)
+        self.model = model
+        self.readiness["Detector"] = "Ready"
+
+    def load_model_background(self, model_path, backend, int8):
+        try:
+            self.load_model(model_path, backend, int8)
+        except Exception as err:
+            self.readiness["Detector"] = f"Error: {str(err)[:20]}"
+            print(f"Detector load error: {err}")
+
+    def warm_up(self, model):
+        # First inference pays for graph/kernel initialisation; run it on a blank frame through the same call
+        # path live frames will take, then drop the tracker state it created
+        width, height = FRAME_SIZE
+        dummy = np.zeros((height, width, 3), dtype=np.uint8)
+        if len(self.streams) > 1:
+            model.predict([dummy] * len(self.streams), conf=0.25, iou=0.45, classes=[2, 3, 5, 7], imgsz=self.imgsz, verbose=False)
+        else:
+            model.track(dummy, persist=True, conf=0.25, iou=0.45, classes=[2, 3, 5, 7], imgsz=self.imgsz, verbose=False)
+            for tracker in getattr(getattr(model, 'predictor', None), 'trackers', None) or []:
+                tracker.reset()
+
+    @property
+    def detector_ready(self):
+        return self.model is not None
+
+    def create_ocr_engine(self):
+        try:
+            from paddleocr import PaddleOCR
+            engine = (PaddleOCR(use_angle_cls=True, lang='en'), PlateLocalizer())
+            self.perform_ocr(np.full((PLATE_HEIGHT, PLATE_HEIGHT * 4, 3), 255, dtype=np.uint8), engine[0], detect=False)
+        except Exception as err:
+            self.readiness["OCR"] = f"Error: {str(err)[:20]}"
+            raise
+        with self.ocr_lock:
+            self.ocr_ready += 1
+            self.readiness["OCR"] = "Ready" if self.ocr_ready >= self.ocr_workers else f"Loading ({self.ocr_ready}/{self.ocr_workers})"
+        return engine
+
+    def add_stream(self, name, role="entry", entry_line=ENTRY_LINE, entry_zone=ENTRY_ZONE, slots=None):
+        self.streams[name] = StreamState(name, self.is_valid_plate, role, entry_line, entry_zone, slots)
+        return self.streams[name]
+
+    @property
+    def vision_enabled(self):
+        return any(stream.slot_occupancy is not None for stream in self.streams.values())
+
+    def get_stream(self, name=None):
+        return self.default_stream if name is None else self.streams[name]
+
+    # Single-camera callers see the first stream's state directly
+    @property
+    def tracks(self):
+        return self.default_stream.tracks
+
+    @property
+    def speed_engine(self):
+        return self.default_stream.speed_engine
+
+    @property
+    def plate_cache(self):
+        return self.default_stream.plate_cache
+
+    @property
+    def entry_events(self):
+        return self.default_stream.entry_events
+
+    @property
+    def frame_index(self):
+        return self.default_stream.frame_index
 
     def set_gui_callback(self, callback):
         self.gui_callback = callback
 
     def setup_mqtt(self):
-        try:
-            client_id = f"SpeedEstimator_{datetime.now().strftime('%Y%m%d%H%M%S')}"
-            client = mqtt.Client(client_id)
-            client.on_connect = self.on_mqtt_connect
-            client.on_disconnect = self.on_disconnect
-            client.on_message = self.on_message
-            client.connect("broker.hivemq.com", 1883, 60)
-            client.loop_start()
-            self.mqtt_status = "Connected"
-            return client
-        except Exception as err:
-            self.mqtt_status = f"Error: {str(err)[:20]}"
+        if mqtt is None:
+            print("paho-mqtt is not installed - MQTT disabled")
             return None
+        subscriptions = [self.TOPIC_SUB_GATE_STATUS, self.TOPIC_SUB_GATE, self.TOPIC_SUB_SLOT_DELTA, self.TOPIC_SUB_RESERVATIONS]
+        return MQTTPublisher(self.create_mqtt_client, subscriptions=subscriptions, on_message=self.on_message, metrics=self.metrics)
 
-    def on_mqtt_connect(self, client, userdata, flags, rc):
-        if rc == 0:
-            self.mqtt_status = "Connected"
-            client.subscribe(self.TOPIC_SUB_GATE_STATUS)
-            client.subscribe(self.TOPIC_SUB_GATE)
-            print(f"Subscribed to: {self.TOPIC_SUB_GATE_STATUS}")
-            print(f"Subscribed to: {self.TOPIC_SUB_GATE}")
-        else:
-            self.mqtt_status = f"Failed: {rc}"
+    def create_mqtt_client(self):
+        client_id = f"SpeedEstimator_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        return mqtt.Client(client_id)
 
-    def on_disconnect(self, client, userdata, rc):
-        self.mqtt_status = "Disconnected"
-        if rc != 0:
-            try:
-                client.reconnect()
-            except:
-                pass
+    @property
+    def mqtt_status(self):
+        if self.mqtt_client is None:
+            return "Disabled" if not self.enable_mqtt else "Unavailable"
+        return getattr(self.mqtt_client, 'status', "Connected")
 
     def on_message(self, client, userdata, msg):
         try:
@@ -85,38 +1424,59 @@ class SpeedEstimator:
             elif topic == self.TOPIC_SUB_GATE:
                 if self.gui_callback:
                     self.gui_callback("gate_control", message)
+            elif topic == self.TOPIC_SUB_SLOT_DELTA:
+                # Bit i of the ESP32's mask is slot i+1; compared against the camera on the next inferred frame
+                delta = json.loads(message)
+                self.ir_slot_mask = int(delta["mask"])
+                self.ir_slot_count = int(delta.get("count", 0))
+                self.ir_changed = True
+                self.occupancy.update_mask("ir", self.ir_slot_mask)
+            elif topic == self.TOPIC_SUB_RESERVATIONS:
+                # One reservation record, or a list of them, as stored in the reservations collection
+                records = json.loads(message)
+                self.occupancy.load_reservations(records if isinstance(records, list) else [records])
         except Exception as e:
             print(f"Error processing MQTT message: {e}")
 
     def send_gate_open_signal(self):
+        # Returns the gate status to log: OPENED, REFUSED (FULL), or ERROR/N/A when nothing could be sent.
+        # Only enqueues; the MQTTPublisher thread delivers, buffering while the broker is unreachable
         if self.mqtt_client is not None:
-            try:
+            slot = self.occupancy.assign()
+            if slot is None and self.occupancy.known:
+                # No OPEN follows; FULL also covers reserved slots the IR sensors still see as free
+                self.mqtt_client.publish(self.TOPIC_PUB_ASSIGN, "FULL")
+                print("No slot available - entry refused")
+                if self.gui_callback:
+                    self.gui_callback("lot_full", "No slot available - entry refused")
+                return GATE_REFUSED
+            if slot is not None:
+                self.mqtt_client.publish(self.TOPIC_PUB_ASSIGN, str(slot))
+                print(f"Assigned slot {slot}")
+            with self.metrics.timer("mqtt_publish"):
                 self.mqtt_client.publish(self.TOPIC_PUB_VEHICLE, "DETECTED")
-                print(f"Published to {self.TOPIC_PUB_VEHICLE}: DETECTED")
-                
                 self.mqtt_client.publish(self.TOPIC_SUB_GATE, "OPEN")
-                print(f"Published to {self.TOPIC_SUB_GATE}: OPEN")
-                
-                if self.gui_callback:
-                    self.gui_callback("vehicle_detected", "🚗 Vehicle Detected - Gate Opening!")
-                    self.gui_callback("gate_command", "🚪 OPEN Command Sent")
-                
-                return True
-            except Exception as err:
-                self.mqtt_status = f"Send Error: {str(err)[:20]}"
-                print(f"MQTT publish error: {err}")
-                return False
-        else:
-            print("MQTT client not connected - cannot send gate signal")
-        return False
+            print(f"Queued to {self.TOPIC_PUB_VEHICLE}: DETECTED")
+            print(f"Queued to {self.TOPIC_SUB_GATE}: OPEN")
+
+            if self.gui_callback:
+                self.gui_callback("vehicle_detected", "🚗 Vehicle Detected - Gate Opening!")
+                self.gui_callback("gate_command", "🚪 OPEN Command Sent")
+
+            return GATE_OPENED
+        if not self.enable_mqtt:
+            return "N/A"
+        print("MQTT unavailable - cannot send gate signal")
+        return "ERROR"
 
     def connect_to_db(self):
         try:
-            client = MongoClient('mongodb://localhost:27017/')
+            client = MongoClient('mongodb://localhost:27017/', serverSelectionTimeoutMS=3000)
             db = client['toycartest']
             collection = db['my_data']
             client.admin.command('ping')
             print("Connected to MongoDB")
+            self.occupancy.load_reservations(db['reservations'].find({'status': 'active'}))
             return collection
         except Exception as err:
             print(f"Database connection error: {err}")
@@ -131,31 +1491,157 @@ class SpeedEstimator:
         sharpened = cv2.filter2D(equalized, -1, kernel)
         return cv2.cvtColor(sharpened, cv2.COLOR_GRAY2BGR)
 
-    def perform_ocr(self, image_array):
+    def is_valid_plate(self, text):
+        return bool(self.car_pattern.match(text) or self.bike_pattern.match(text))
+
+    def perform_ocr(self, image_array, ocr_engine, detect=True):
+        # With detect=False the image must already be a plate crop and only PaddleOCR recognition runs
         if image_array is None or not isinstance(image_array, np.ndarray):
-            return ""
-        results = self.ocr.ocr(image_array, rec=True)
-        text = ' '.join([result[1][0] for result in results[0]] if results[0] else "")
+            return "", 0.0
+        results = ocr_engine.ocr(image_array, det=detect, rec=True, cls=detect)
+        lines = [line[1] if detect else line for line in (results[0] or [])]
+        text = ' '.join(line[0] for line in lines)
         clean_text = ''.join(char for char in text if char.isalnum()).upper()
-        if self.car_pattern.match(clean_text) or self.bike_pattern.match(clean_text):
-            return clean_text
-        return ""
+        if self.is_valid_plate(clean_text):
+            return clean_text, sum(line[1] for line in lines) / len(lines)
+        return "", 0.0
+
+    def recognize_plate(self, engine, roi):
+        ocr_engine, localizer = engine
+        with self.metrics.timer("localize"):
+            plates = localizer.locate(roi)
+        with self.metrics.timer("ocr"):
+            for plate in plates:
+                text, score = self.perform_ocr(self.preprocess_roi(plate), ocr_engine, detect=False)
+                if text:
+                    return text, score
+            if plates:
+                return "", 0.0
+            # Nothing plate-like was found: fall back to full detection on the lower part of the vehicle
+            return self.perform_ocr(self.preprocess_roi(roi[roi.shape[0] // 3:]), ocr_engine)
+
+    def publish_metrics(self):
+        if self.mqtt_client is None:
+            return False
+        self.mqtt_client.publish(self.TOPIC_PUB_METRICS, json.dumps(self.metrics.snapshot()))
+        return True
+
+    def update_slot_occupancy(self, stream, boxes, now):
+        with self.metrics.timer("slot_occupancy"):
+            changes = stream.slot_occupancy.update(boxes)
+        for slot, occupied in changes:
+            self.vision_slots[slot] = occupied
+        if changes:
+            self.occupancy.update("vision", changes)
+        flags_changed = False
+        if changes or self.ir_changed or self.slot_disagreements:
+            self.ir_changed = False
+            flags_changed = self.check_slot_agreement(now)
+        if changes or flags_changed:
+            self.publish_slot_occupancy()
+        return changes
+
+    def check_slot_agreement(self, now):
+        # A slot is flagged once camera and IR have disagreed for SLOT_DISAGREE_SECONDS; returns True if the set changed
+        mask = self.ir_slot_mask
+        if mask is None:
+            return False
+        flagged = set()
+        for slot, occupied in self.vision_slots.items():
+            if slot > self.ir_slot_count or occupied == bool(mask >> (slot - 1) & 1):
+                self.slot_disagreements.pop(slot, None)
+                continue
+            since = self.slot_disagreements.setdefault(slot, now)
+            if now - since >= SLOT_DISAGREE_SECONDS:
+                flagged.add(slot)
+        if flagged == self.flagged_slots:
+            return False
+        new = flagged - self.flagged_slots
+        self.flagged_slots = flagged
+        if new:
+            self.metrics.increment("slot_disagreements", len(new))
+            if self.gui_callback:
+                self.gui_callback("slot_disagreement", f"Camera and IR disagree on slot {', '.join(map(str, sorted(new)))}")
+        return True
+
+    def publish_slot_occupancy(self):
+        if self.mqtt_client is None:
+            return False
+        self.mqtt_client.publish(self.TOPIC_PUB_SLOT_VISION, json.dumps({
+            'occupied': sorted(slot for slot, occupied in self.vision_slots.items() if occupied),
+            'free': sorted(slot for slot, occupied in self.vision_slots.items() if not occupied),
+            'disagree': sorted(self.flagged_slots)
+        }))
+        return True
+
+    def publish_occupancy(self, delta):
+        # Deltas for gates and dashboards that follow along, plus a retained snapshot for late subscribers
+        self.mqtt_client.publish(self.TOPIC_PUB_OCCUPANCY_DELTA, json.dumps(delta, separators=(',', ':')))
+        self.mqtt_client.publish(self.TOPIC_PUB_OCCUPANCY, json.dumps(self.occupancy.snapshot(), separators=(',', ':')))
+        return True
+
+    def collect_ocr_results(self, current_time):
+        # OCR jobs are keyed by (stream name, track id) since track ids are only unique per camera
+        for (stream_name, track_id), result, context in self.ocr_pool.poll_results():
+            if result is None:
+                continue
+            stream = self.streams[stream_name]
+            plate = stream.plate_cache.add_read(track_id, *result)
+            if plate:
+                self.record_plate(stream, track_id, plate, stream.plate_cache.tracks[track_id]['context'], current_time)
+
+    def evict_tracks(self, stream, now, current_time, evict_all=False):
+        evicted = stream.tracks.evict_all() if evict_all else stream.tracks.evict_stale(stream.frame_index, now)
+        for track_id in evicted:
+            evicted_plate = stream.plate_cache.evict(track_id)
+            if evicted_plate is not None:
+                self.record_plate(stream, track_id, evicted_plate[0], evicted_plate[1], current_time)
+            stream.entry_events.forget(track_id)
+            stream.speed_engine.release(track_id)
+
+    def record_plate(self, stream, track_id, plate, context, current_time):
+        arrival = stream.entry_events.arrival(track_id)
+        detection_count = arrival[0] if arrival is not None else context['detection_count']
+        if self.db_writer is not None:
+            self.db_writer.submit({
+                'date': current_time.strftime("%Y-%m-%d"),
+                'time': current_time.strftime("%H:%M:%S"),
+                'camera': stream.name,
+                'direction': stream.role,
+                'track_id': int(track_id),
+                'class_name': context['class_name'],
+                'speed': float(context['speed']),
+                'numberplate': plate,
+                'vehicle_type': 'car' if self.car_pattern.match(plate) else 'bike',
+                'detection_count': detection_count
+            })
+
+        self.new_detections.append({
+            'event': 'plate',
+            'stream': stream.name,
+            'time': current_time.strftime("%H:%M:%S"),
+            'track_id': track_id,
+            'speed': context['speed'],
+            'numberplate': plate,
+            'vehicle_type': context['class_name'],
+            'gate_status': 'N/A',
+            'detection_count': detection_count if detection_count is not None else 'N/A'
+        })
 
     def save_to_database(self, date, time_str, track_id, class_name, speed, numberplate):
         try:
-            document = {
-                'date': date,
-                'time': time_str,
-                'track_id': track_id,
-                'class_name': class_name,
-                'speed': speed,
-                'numberplate': numberplate,
-                'vehicle_type': 'car' if self.car_pattern.match(numberplate) else 'bike'
-            }
-            if self.db_connection is not None:
-                self.db_connection.insert_one(document)
+            if self.db_writer is not None:
+                self.db_writer.submit({
+                    'date': date,
+                    'time': time_str,
+                    'track_id': int(track_id),
+                    'class_name': class_name,
+                    'speed': float(speed),
+                    'numberplate': numberplate,
+                    'vehicle_type': 'car' if self.car_pattern.match(numberplate) else 'bike'
+                })
             
-            gate_opened = self.send_gate_open_signal()
+            gate_status = self.send_gate_open_signal()
             
             self.new_detections.append({
                 'time': time_str,
@@ -163,7 +1649,7 @@ class SpeedEstimator:
                 'speed': speed,
                 'numberplate': numberplate,
                 'vehicle_type': class_name,
-                'gate_status': 'OPENED' if gate_opened else 'ERROR'
+                'gate_status': gate_status
             })
             return True
         except Exception as e:
@@ -171,151 +1657,690 @@ class SpeedEstimator:
             self.send_gate_open_signal()
             return True
 
-    def estimate_speed(self, im0):
+    def estimate_speed(self, im0, timestamp=None, stream=None):
+        stream = self.get_stream(stream)
+        if stream is not self.default_stream:
+            # model.track persists a single tracker, so the other streams use their own via the batched path
+            return self.estimate_batch({stream.name: im0}, timestamp)[stream.name]
+        with self.metrics.timer("track"):
+            results = self.model.track(im0, persist=True, conf=0.25, iou=0.45, classes=[2, 3, 5, 7], imgsz=self.imgsz)
+        boxes = results[0].boxes
+        if boxes is None or boxes.id is None:
+            return self.process_tracks(stream, im0, None, None, None, timestamp)
+        return self.process_tracks(stream, im0, boxes.xyxy.cpu().numpy(), boxes.id.cpu().numpy().astype(int),
+                                   boxes.cls.cpu().numpy(), timestamp)
+
+    def estimate_batch(self, frames, timestamp=None):
+        # One detector pass over every stream's frame, then each stream's own ByteTrack instance assigns ids
+        names = list(frames)
+        with self.metrics.timer("track"):
+            results = self.model.predict([frames[name] for name in names], conf=0.25, iou=0.45, classes=[2, 3, 5, 7],
+                                         imgsz=self.imgsz, verbose=False)
+        processed = {}
+        for name, result in zip(names, results):
+            stream = self.streams[name]
+            if stream.tracker is None:
+                stream.tracker = create_tracker()
+            tracked = stream.tracker.update(result.boxes.cpu().numpy(), frames[name])
+            if len(tracked):
+                processed[name] = self.process_tracks(stream, frames[name], tracked[:, :4], tracked[:, 4].astype(int),
+                                                      tracked[:, 6], timestamp)
+            else:
+                processed[name] = self.process_tracks(stream, frames[name], None, None, None, timestamp)
+        return processed
+
+    def process_tracks(self, stream, im0, boxes, track_ids, classes, timestamp=None):
+        from ultralytics.utils.plotting import Annotator, colors
         annotator = Annotator(im0, line_width=2)
-        results = self.model.track(im0, persist=True, conf=0.25, iou=0.45, classes=[2, 3, 5, 7])
         current_time = datetime.now()
+        now = timestamp if timestamp is not None else time()
+        stream.frame_index += 1
+        self.collect_ocr_results(current_time)
+        if stream.slot_occupancy is not None:
+            self.update_slot_occupancy(stream, boxes, now)
+            stream.slot_occupancy.draw(im0, self.flagged_slots)
+            if stream.role == "slots":
+                return im0
+        stream.entry_events.draw(im0)
 
-        if results[0].boxes is not None and results[0].boxes.id is not None:
-            boxes = results[0].boxes.xyxy.cpu().numpy()
-            track_ids = results[0].boxes.id.cpu().numpy().astype(int)
-            classes = results[0].boxes.cls.cpu().numpy()
+        if boxes is not None:
+            speeds = stream.speed_engine.update(track_ids, boxes, now)
 
-            for box, track_id, cls in zip(boxes, track_ids, classes):
+            for box, track_id, cls, speed in zip(boxes, track_ids, classes, speeds):
                 x1, y1, x2, y2 = map(int, box)
-                if track_id not in self.trk_pt:
-                    self.trk_pt[track_id] = time()
-                    self.trk_pp[track_id] = (x1, y1)
-                
-                time_diff = time() - self.trk_pt[track_id]
-                dist = np.linalg.norm(np.array(self.trk_pp[track_id]) - np.array((x1, y1)))
-                speed = (dist / time_diff) * 3.6 if time_diff > 0 else 0
-                self.spd[track_id] = round(speed, 2)
-                self.trk_pt[track_id] = time()
-                self.trk_pp[track_id] = (x1, y1)
+                record = stream.tracks.touch(track_id, stream.frame_index, now)
+                record.speed = float(speed)
 
                 class_name = self.model.names[int(cls)]
-                label = f"ID: {track_id} {class_name} {self.spd[track_id]} km/h"
+                label = f"ID: {track_id} {class_name} {record.speed} km/h"
                 annotator.box_label(box, label=label, color=colors(track_id % 80, True))
 
-                self.detection_counter += 1
-                gate_opened = self.send_gate_open_signal()
-                
-                detection_record = {
-                    'time': current_time.strftime("%H:%M:%S"),
-                    'track_id': track_id,
-                    'speed': self.spd[track_id],
-                    'numberplate': 'Processing...',
-                    'vehicle_type': class_name,
-                    'gate_status': 'OPENED' if gate_opened else 'ERROR',
-                    'detection_count': self.detection_counter
-                }
-                self.new_detections.append(detection_record)
-                
-                gate_status = "GATE OPENING" if gate_opened else "GATE ERROR"
-                detection_label = f"VEHICLE DETECTED #{self.detection_counter} - {gate_status}"
-                cv2.putText(
-                    im0,
-                    detection_label,
-                    (x1, y1 - 50),
-                    cv2.FONT_HERSHEY_SIMPLEX,
-                    0.6,
-                    (0, 255, 0) if gate_opened else (0, 0, 255),
-                    2
-                )
-
-                if x2 > x1 and y2 > y1:
-                    roi = im0[y1:y2, x1:x2]
-                    preprocessed_roi = self.preprocess_roi(roi)
-                    ocr_text = self.perform_ocr(preprocessed_roi)
-                    if ocr_text.strip():
-                        try:
-                            if self.db_connection is not None:
-                                document = {
-                                    'date': current_time.strftime("%Y-%m-%d"),
-                                    'time': current_time.strftime("%H:%M:%S"),
-                                    'track_id': track_id,
-                                    'class_name': class_name,
-                                    'speed': self.spd[track_id],
-                                    'numberplate': ocr_text,
-                                    'vehicle_type': 'car' if self.car_pattern.match(ocr_text) else 'bike',
-                                    'detection_count': self.detection_counter
-                                }
-                                self.db_connection.insert_one(document)
-                        except Exception as e:
-                            print(f"Database update error: {e}")
-                        
-                        vehicle_type = 'car' if self.car_pattern.match(ocr_text) else 'bike'
-                        plate_label = f"{ocr_text} ({vehicle_type})"
-                        cv2.putText(
-                            im0,
-                            plate_label,
-                            (x1, y1 - 30),
-                            cv2.FONT_HERSHEY_SIMPLEX,
-                            0.5,
-                            (0, 255, 255),
-                            2
-                        )
+                if stream.entry_events.update(track_id, ((x1 + x2) / 2, y2), now):
+                    self.detection_counter += 1
+                    # Exit cameras only log the vehicle; the gate is driven by entry cameras
+                    gate_status = self.send_gate_open_signal() if stream.role == "entry" else None
+                    stream.entry_events.set_arrival(track_id, (self.detection_counter, gate_status))
+                    self.new_detections.append({
+                        'event': 'arrival' if stream.role == "entry" else 'exit',
+                        'stream': stream.name,
+                        'time': current_time.strftime("%H:%M:%S"),
+                        'track_id': track_id,
+                        'speed': record.speed,
+                        'numberplate': stream.plate_cache.plate(track_id) or 'Processing...',
+                        'vehicle_type': class_name,
+                        'gate_status': gate_status or 'N/A',
+                        'detection_count': self.detection_counter
+                    })
+
+                arrival = stream.entry_events.arrival(track_id)
+                if arrival is not None:
+                    detection_count, gate_status = arrival
+                    if gate_status is None:
+                        detection_label = f"VEHICLE EXIT #{detection_count}"
+                    else:
+                        gate_text = {GATE_OPENED: "GATE OPENING", GATE_REFUSED: GATE_REFUSED}.get(gate_status, "GATE ERROR")
+                        detection_label = f"VEHICLE DETECTED #{detection_count} - {gate_text}"
+                    cv2.putText(
+                        im0,
+                        detection_label,
+                        (x1, y1 - 50),
+                        cv2.FONT_HERSHEY_SIMPLEX,
+                        0.6,
+                        (0, 255, 0) if gate_status in (None, GATE_OPENED) else (0, 0, 255),
+                        2
+                    )
+
+                stream.plate_cache.mark_seen(track_id, {
+                    'class_name': class_name,
+                    'speed': record.speed,
+                    'detection_count': arrival[0] if arrival is not None else None
+                })
+                if x2 > x1 and y2 > y1 and stream.plate_cache.needs_ocr(track_id):
+                    self.ocr_pool.submit((stream.name, track_id), im0[max(y1, 0):y2, max(x1, 0):x2].copy())
+
+                ocr_text = stream.plate_cache.plate(track_id)
+                if ocr_text:
+                    vehicle_type = 'car' if self.car_pattern.match(ocr_text) else 'bike'
+                    plate_label = f"{ocr_text} ({vehicle_type})"
+                    cv2.putText(
+                        im0,
+                        plate_label,
+                        (x1, y1 - 30),
+                        cv2.FONT_HERSHEY_SIMPLEX,
+                        0.5,
+                        (0, 255, 255),
+                        2
+                    )
+
+        self.evict_tracks(stream, now, current_time)
         return im0
 
+    def flush_tracks(self):
+        # Finish outstanding OCR and retire every live track, e.g. at the end of a recorded clip
+        # Returns False if OCR could not finish, in which case tracks are retired with whatever reads they have
+        current_time = datetime.now()
+        finished = self.ocr_pool.wait_idle(OCR_FLUSH_TIMEOUT)
+        if not finished:
+            print("OCR did not finish before the flush - retiring tracks without pending reads")
+        self.collect_ocr_results(current_time)
+        for stream in self.streams.values():
+            self.evict_tracks(stream, time(), current_time, evict_all=True)
+        return finished
+
+    def reset_tracking(self):
+        self.flush_tracks()
+        predictor = getattr(self.model, 'predictor', None)
+        for tracker in getattr(predictor, 'trackers', None) or []:
+            tracker.reset()
+        for stream in self.streams.values():
+            if stream.tracker is not None:
+                stream.tracker.reset()
+            stream.entry_events.last_event = float('-inf')
+
     def cleanup(self):
         if self.mqtt_client is not None:
+            self.mqtt_client.publish(self.TOPIC_PUB_VEHICLE, "NONE")
+            self.mqtt_client.wait_idle(timeout=0.5)
+
+    def shutdown(self):
+        self.ocr_pool.shutdown()
+        if self.db_writer is not None:
+            self.db_writer.shutdown()
+        if self.mqtt_client is not None:
+            self.mqtt_client.shutdown()
+
+class InferenceScheduler:
+    def __init__(self, speed_estimator, stream=None, stride=IDLE_INFERENCE_STRIDE, hold_frames=MOTION_HOLD_FRAMES):
+        self.speed_estimator = speed_estimator
+        self.stream = speed_estimator.get_stream(stream)
+        self.stride = stride
+        self.hold_frames = hold_frames
+        self.background = None
+        self.frames_since_motion = hold_frames + 1
+        self.frames_since_inference = 0
+        self.active = True
+        gauge = "inference_active" if self.stream is speed_estimator.default_stream else f"inference_active_{self.stream.name}"
+        speed_estimator.metrics.register_gauge(gauge, lambda: int(self.active))
+
+    def has_motion(self, frame):
+        small = cv2.cvtColor(cv2.resize(frame, MOTION_SCALE, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        small = cv2.GaussianBlur(small, (5, 5), 0)
+        if self.background is None:
+            self.background = small.astype(np.float32)
+            return True
+        diff = cv2.absdiff(small, cv2.convertScaleAbs(self.background))
+        cv2.accumulateWeighted(small, self.background, 0.05)
+        return np.count_nonzero(diff > MOTION_PIXEL_THRESHOLD) >= MOTION_MIN_CHANGED * diff.size
+
+    def should_infer(self, frame):
+        # Full-rate inference while there is motion or any live track, so the tracker never loses a vehicle;
+        # a static, empty scene only gets a YOLO pass every stride frames
+        if not self.speed_estimator.detector_ready:
+            return False
+        self.frames_since_motion = 0 if self.has_motion(frame) else self.frames_since_motion + 1
+        self.active = self.frames_since_motion <= self.hold_frames or len(self.stream.tracks) > 0
+        self.frames_since_inference += 1
+        if self.active or self.frames_since_inference >= self.stride:
+            self.frames_since_inference = 0
+            return True
+        return False
+
+    def mark_idle(self, frame):
+        self.speed_estimator.metrics.increment("frames_skipped")
+        self.stream.entry_events.draw(frame)
+        status = "IDLE" if self.speed_estimator.detector_ready else f"MODEL {self.speed_estimator.readiness['Detector'].upper()}"
+        cv2.putText(frame, status, (10, 25), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (160, 160, 160), 2)
+        return frame
+
+    def process(self, frame, timestamp=None):
+        if self.should_infer(frame):
+            return self.speed_estimator.estimate_speed(frame, timestamp, self.stream.name)
+        return self.mark_idle(frame)
+
+class LatestFrameQueue:
+    def __init__(self, maxsize=1):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def put(self, item):
+        # Latest frame wins: when the consumer falls behind, drop the oldest frame instead of blocking
+        while True:
             try:
-                self.mqtt_client.publish(self.TOPIC_PUB_VEHICLE, "NONE")
-                time.sleep(0.5)
-                self.mqtt_client.loop_stop()
-                self.mqtt_client.disconnect()
-            except Exception:
-                pass
+                self.queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def get_nowait(self):
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            return None
+
+    def qsize(self):
+        return self.queue.qsize()
+
+class FramePipeline:
+    def __init__(self, captures, speed_estimator, frame_size=FRAME_SIZE):
+        # captures maps stream name -> (cv2.VideoCapture, frame_interval) as returned by open_source
+        self.captures = captures
+        self.speed_estimator = speed_estimator
+        self.schedulers = {name: InferenceScheduler(speed_estimator, name) for name in captures}
+        self.frame_size = frame_size
+        self.capture_queues = {name: LatestFrameQueue() for name in captures}
+        self.display_queue = LatestFrameQueue()
+        self.latest = {}
+        self.stop_event = threading.Event()
+        self.threads = []
+        self.captured = 0
+        self.processed = 0
+        self.capture_failures = 0
+
+    def start(self):
+        metrics = self.speed_estimator.metrics
+        metrics.register_gauge("capture_queue", lambda: sum(frame_queue.qsize() for frame_queue in self.capture_queues.values()))
+        metrics.register_gauge("display_queue", self.display_queue.qsize)
+        metrics.register_gauge("dropped_frames", lambda: self.dropped_frames)
+        metrics.register_gauge("display_skipped", lambda: self.display_queue.dropped)
+        self.stop_event.clear()
+        self.threads = [threading.Thread(target=self.capture_loop, args=(name,), name=f"capture-{name}", daemon=True)
+                        for name in self.captures]
+        self.threads.append(threading.Thread(target=self.inference_loop, name="inference", daemon=True))
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self, timeout=2.0):
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join(timeout)
+        self.threads = []
+
+    def capture_loop(self, name):
+        metrics = self.speed_estimator.metrics
+        cap, frame_interval = self.captures[name]
+        frame_queue = self.capture_queues[name]
+        next_frame = time()
+        while not self.stop_event.is_set():
+            if frame_interval:
+                self.stop_event.wait(max(0.0, next_frame - time()))
+                next_frame = max(next_frame + frame_interval, time())
+            with metrics.timer("capture"):
+                ret, frame = cap.read()
+            if not ret:
+                if frame_interval:
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    continue
+                self.capture_failures += 1
+                metrics.increment("capture_failures")
+                self.stop_event.wait(0.05)
+                continue
+            self.captured += 1
+            frame_queue.put(cv2.resize(frame, self.frame_size))
+
+    def next_frames(self):
+        if len(self.capture_queues) == 1:
+            name, frame_queue = next(iter(self.capture_queues.items()))
+            frame = frame_queue.get(timeout=0.1)
+            return {name: frame} if frame is not None else {}
+        frames = {}
+        for name, frame_queue in self.capture_queues.items():
+            frame = frame_queue.get_nowait()
+            if frame is not None:
+                frames[name] = frame
+        if not frames:
+            self.stop_event.wait(0.005)
+        return frames
+
+    def infer(self, frames):
+        if len(self.captures) == 1:
+            return {name: self.schedulers[name].process(frame) for name, frame in frames.items()}
+        # Frames from every stream that needs inference share one batched detector call
+        active = {name: frame for name, frame in frames.items() if self.schedulers[name].should_infer(frame)}
+        processed = self.speed_estimator.estimate_batch(active) if active else {}
+        for name, frame in frames.items():
+            if name not in processed:
+                processed[name] = self.schedulers[name].mark_idle(frame)
+        return processed
+
+    def inference_loop(self):
+        metrics = self.speed_estimator.metrics
+        while not self.stop_event.is_set():
+            frames = self.next_frames()
+            if not frames:
+                continue
+            try:
+                with metrics.timer("frame"):
+                    processed = self.infer(frames)
+            except Exception as e:
+                print(f"Inference error: {e}")
+                metrics.increment("inference_errors")
+                continue
+            self.latest.update(processed)
+            self.processed += len(processed)
+            metrics.increment("frames_processed", len(processed))
+            self.display_queue.put(self.compose())
+
+    def compose(self):
+        if len(self.captures) == 1:
+            return next(iter(self.latest.values()))
+        # Tile the latest frame of every stream into one display frame
+        width, height = self.frame_size
+        columns = int(np.ceil(np.sqrt(len(self.captures))))
+        rows = int(np.ceil(len(self.captures) / columns))
+        tile_width, tile_height = width // columns, height // rows
+        mosaic = np.zeros((height, width, 3), dtype=np.uint8)
+        for position, name in enumerate(self.captures):
+            frame = self.latest.get(name)
+            if frame is None:
+                continue
+            row, column = divmod(position, columns)
+            x, y = column * tile_width, row * tile_height
+            mosaic[y:y + tile_height, x:x + tile_width] = cv2.resize(frame, (tile_width, tile_height), interpolation=cv2.INTER_AREA)
+            cv2.putText(mosaic, name, (x + 8, y + tile_height - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+        return mosaic
+
+    def latest_frame(self):
+        return self.display_queue.get_nowait()
+
+    @property
+    def dropped_frames(self):
+        # Frames that never reached inference; frames replaced before the capped display shows them are expected
+        return sum(frame_queue.dropped for frame_queue in self.capture_queues.values())
+
+class EventBus:
+    def __init__(self, state_events=("gate_status",)):
+        # Producers on any thread only enqueue; the Tk loop drains. State events keep just their latest value
+        self.events = queue.SimpleQueue()
+        self.state_events = set(state_events)
+
+    def publish(self, event_type, message):
+        self.events.put((event_type, message))
+
+    def drain(self):
+        # Returns (event_type, message, count) in arrival order with duplicates merged
+        pending = OrderedDict()
+        while True:
+            try:
+                event_type, message = self.events.get_nowait()
+            except queue.Empty:
+                break
+            key = event_type if event_type in self.state_events else (event_type, message)
+            count = pending.pop(key)[1] + 1 if key in pending and key not in self.state_events else 1
+            pending[key] = ((event_type, message), count)
+        return [(event_type, message, count) for (event_type, message), count in pending.values()]
+
+class Toast:
+    COLORS = {
+        "success": "#10b981",
+        "warning": "#f59e0b",
+        "error": "#ef4444",
+        "info": "#3b82f6"
+    }
+
+    def __init__(self, parent, duration_ms=TOAST_DURATION_MS, min_interval=TOAST_MIN_INTERVAL):
+        # One widget for every notification: shown, retexted and hidden instead of created per event
+        self.frame = tk.Frame(parent, bg="#1e293b", relief="solid", bd=1)
+        self.label = tk.Label(self.frame, bg="#1e293b", font=("Segoe UI", 11, "bold"))
+        self.label.pack(pady=8, padx=10)
+        self.duration_ms = duration_ms
+        self.min_interval = min_interval
+        self.last_shown = float('-inf')
+        self.pending = None
+        self.pending_job = None
+        self.hide_job = None
+
+    def show(self, message, notification_type="info"):
+        wait = self.min_interval - (time() - self.last_shown)
+        if wait > 0:
+            # Rate limited: only the newest message waiting for the slot is shown
+            self.pending = (message, notification_type)
+            if self.pending_job is None:
+                self.pending_job = self.frame.after(int(wait * 1000), self.show_pending)
+            return
+        self.display(message, notification_type)
+
+    def show_pending(self):
+        self.pending_job = None
+        if self.pending is not None:
+            message, notification_type = self.pending
+            self.pending = None
+            self.display(message, notification_type)
+
+    def display(self, message, notification_type):
+        self.last_shown = time()
+        self.label.configure(text=message, fg=self.COLORS.get(notification_type, "#3b82f6"))
+        self.frame.place(relx=0.02, rely=0.02, relwidth=0.4)
+        self.frame.lift()
+        if self.hide_job is not None:
+            self.frame.after_cancel(self.hide_job)
+        self.hide_job = self.frame.after(self.duration_ms, self.hide)
+
+    def hide(self):
+        self.hide_job = None
+        self.frame.place_forget()
+
+class DisplayRenderer:
+    def __init__(self, widget=None, fallback_size=FRAME_SIZE):
+        self.widget = widget
+        self.fallback_size = fallback_size
+        self.size = None
+        self.scaled = None
+        self.rgba = None
+        self.image = None
+        self.photo = None
+
+    def target_size(self, frame):
+        # Fit inside the label keeping the aspect ratio; a few pixels are left spare so the label never
+        # requests more room than it was given and makes the window grow
+        width, height = self.fallback_size
+        if self.widget is not None and self.widget.winfo_width() > 16 and self.widget.winfo_height() > 16:
+            width, height = self.widget.winfo_width() - 8, self.widget.winfo_height() - 8
+        scale = min(width / frame.shape[1], height / frame.shape[0])
+        return max(1, int(frame.shape[1] * scale)), max(1, int(frame.shape[0] * scale))
+
+    def allocate(self, size):
+        width, height = size
+        self.size = size
+        self.scaled = np.empty((height, width, 3), dtype=np.uint8)
+        self.rgba = np.empty((height, width, 4), dtype=np.uint8)
+        # RGBA is one of PIL's mappable modes, so the image shares memory with self.rgba instead of copying it
+        self.image = Image.frombuffer("RGBA", size, self.rgba, "raw", "RGBA", 0, 1)
+        if self.widget is not None:
+            self.photo = ImageTk.PhotoImage(image=self.image)
+            self.widget.configure(image=self.photo)
+
+    def render(self, frame):
+        size = self.target_size(frame)
+        if size != self.size:
+            self.allocate(size)
+        if size == (frame.shape[1], frame.shape[0]):
+            cv2.cvtColor(frame, cv2.COLOR_BGR2RGBA, dst=self.rgba)
+        else:
+            interpolation = cv2.INTER_AREA if size[0] < frame.shape[1] else cv2.INTER_LINEAR
+            cv2.resize(frame, size, dst=self.scaled, interpolation=interpolation)
+            cv2.cvtColor(self.scaled, cv2.COLOR_BGR2RGBA, dst=self.rgba)
+        if self.photo is not None:
+            self.photo.paste(self.image)
+        return self.image
+
+    def reset(self):
+        self.size = None
+        self.scaled = self.rgba = self.image = self.photo = None
+
+class DetectionLog:
+    def __init__(self, capacity=LOG_CAPACITY):
+        # Fixed-size ring of formatted lines addressed by a monotonically increasing sequence number;
+        # by_plate/by_track hold each key's live sequence numbers oldest first, so eviction is O(1)
+        self.capacity = capacity
+        self.slots = [None] * capacity
+        self.first_seq = 0
+        self.next_seq = 0
+        self.by_plate = {}
+        self.by_track = {}
+
+    def __len__(self):
+        return self.next_seq - self.first_seq
+
+    def append(self, text, plate=None, track_id=None):
+        if len(self) == self.capacity:
+            self.evict()
+        seq = self.next_seq
+        plate = plate.upper() if plate and self.is_plate(plate) else None
+        self.slots[seq % self.capacity] = (text, plate, track_id)
+        if plate is not None:
+            self.by_plate.setdefault(plate, deque()).append(seq)
+        if track_id is not None:
+            self.by_track.setdefault(track_id, deque()).append(seq)
+        self.next_seq += 1
+        return seq
+
+    def evict(self):
+        _, plate, track_id = self.slots[self.first_seq % self.capacity]
+        for key, index in ((plate, self.by_plate), (track_id, self.by_track)):
+            if key is not None:
+                seqs = index[key]
+                seqs.popleft()
+                if not seqs:
+                    del index[key]
+        self.slots[self.first_seq % self.capacity] = None
+        self.first_seq += 1
+
+    def is_plate(self, text):
+        return text.isalnum()
+
+    def line(self, seq):
+        return self.slots[seq % self.capacity][0]
+
+    def matches(self, seq, query):
+        _, plate, track_id = self.slots[seq % self.capacity]
+        track_query = query.lstrip("#")
+        return bool(plate and query in plate) or (track_query.isdigit() and track_id == int(track_query))
+
+    def search(self, query):
+        # Plate substrings are matched against the distinct plates only, never against every line;
+        # "#12" or "12" also matches track id 12. Returns None for an empty query (no filter).
+        query = query.strip().upper()
+        if not query:
+            return None
+        seqs = set()
+        track_query = query.lstrip("#")
+        if track_query.isdigit():
+            seqs.update(self.by_track.get(int(track_query), ()))
+        for plate, plate_seqs in self.by_plate.items():
+            if query in plate:
+                seqs.update(plate_seqs)
+        return sorted(seqs)
+
+class DetectionLogView:
+    def __init__(self, parent, log, font=("Segoe UI", 10)):
+        # Only the rows that fit in the widget are ever inserted into the Text; the scrollbar is driven
+        # from the log's row count rather than from the Text contents
+        self.log = log
+        self.query = ""
+        self.matches = None
+        self.top_seq = None
+        self.follow = True
+        self.rendered = None
+        self.line_height = max(1, tkfont.Font(font=font).metrics("linespace"))
+        self.scrollbar = tk.Scrollbar(parent, command=self.on_scroll)
+        self.scrollbar.pack(side="right", fill="y")
+        self.text = tk.Text(parent, bg="#1e293b", fg="white", font=font, wrap="none", state="disabled")
+        self.text.pack(fill="both", expand=True)
+        self.text.bind("<Configure>", lambda event: self.refresh())
+        self.text.bind("<MouseWheel>", lambda event: self.scroll_by(-1 if event.delta > 0 else 1) or "break")
+        self.text.bind("<Button-4>", lambda event: self.scroll_by(-1) or "break")
+        self.text.bind("<Button-5>", lambda event: self.scroll_by(1) or "break")
+
+    def added(self, seq):
+        if self.matches is not None and self.log.matches(seq, self.query):
+            self.matches.append(seq)
+
+    def set_filter(self, query):
+        self.query = query.strip().upper()
+        self.matches = self.log.search(self.query)
+        self.follow = True
+        self.refresh()
+
+    def row_count(self):
+        if self.matches is None:
+            return len(self.log)
+        if self.matches and self.matches[0] < self.log.first_seq:
+            del self.matches[:bisect_left(self.matches, self.log.first_seq)]
+        return len(self.matches)
+
+    def row_seq(self, row):
+        return self.log.first_seq + row if self.matches is None else self.matches[row]
+
+    def row_of(self, seq):
+        if self.matches is None:
+            return max(0, seq - self.log.first_seq)
+        return bisect_left(self.matches, seq)
+
+    def visible_rows(self):
+        return max(1, self.text.winfo_height() // self.line_height)
+
+    def top_row(self, count, visible):
+        if self.follow or self.top_seq is None:
+            return max(0, count - visible)
+        return min(self.row_of(self.top_seq), max(0, count - visible))
+
+    def scroll_to(self, row):
+        count, visible = self.row_count(), self.visible_rows()
+        row = max(0, min(row, count - visible))
+        self.follow = row >= count - visible
+        self.top_seq = self.row_seq(row) if count else None
+        self.refresh()
+
+    def scroll_by(self, rows):
+        count, visible = self.row_count(), self.visible_rows()
+        self.scroll_to(self.top_row(count, visible) + rows)
+
+    def on_scroll(self, *args):
+        count, visible = self.row_count(), self.visible_rows()
+        if args[0] == "moveto":
+            self.scroll_to(int(float(args[1]) * count))
+        else:
+            self.scroll_by(int(args[1]) * (visible if args[2] == "pages" else 1))
+
+    def refresh(self):
+        count, visible = self.row_count(), self.visible_rows()
+        top = self.top_row(count, visible)
+        seqs = [self.row_seq(row) for row in range(top, min(count, top + visible))]
+        if not self.follow and seqs:
+            self.top_seq = seqs[0]
+        self.scrollbar.set(top / count, (top + len(seqs)) / count) if count else self.scrollbar.set(0, 1)
+        if seqs == self.rendered:
+            return
+        self.rendered = seqs
+        self.text.configure(state="normal")
+        self.text.delete("1.0", tk.END)
+        self.text.insert("1.0", "\n".join(self.log.line(seq) for seq in seqs))
+        self.text.configure(state="disabled")
 
 class ParkingSystemGUI:
     def __init__(self):
+        if tk is None:
+            raise RuntimeError("tkinter/Pillow ImageTk is not installed - the GUI needs python3-tk; use batch_process.py to run headless")
         self.root = tk.Tk()
         self.root.title("Parking System - Entry Monitoring")
         self.root.geometry("1280x720")
         self.root.configure(bg="#0f1419")
-        self.cap = None
+        self.captures = {}
+        self.pipeline = None
         self.is_running = False
-        self.speed_estimator = SpeedEstimator()
-        self.speed_estimator.set_gui_callback(self.handle_mqtt_callback)
-        self.notification_queue = []
+        self.speed_estimator = SpeedEstimator(streams=CAMERA_SOURCES, lazy=True)
+        # MQTT and inference threads publish here; process_events applies them on the Tk thread
+        self.event_bus = EventBus()
+        self.speed_estimator.set_gui_callback(self.event_bus.publish)
+        self.last_fps_sample = (time(), 0)
+        try:
+            self.metrics_server = MetricsServer(self.speed_estimator.metrics)
+        except OSError as err:
+            print(f"Metrics endpoint unavailable: {err}")
+            self.metrics_server = None
         self.setup_gui()
 
-    def handle_mqtt_callback(self, event_type, message):
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        
+    def process_events(self):
+        for event_type, message, count in self.event_bus.drain():
+            self.handle_event(event_type, message, count)
+        self.root.after(EVENT_POLL_MS, self.process_events)
+
+    def show_event_notification(self, message, notification_type, count):
+        self.show_notification(f"{message} (x{count})" if count > 1 else message, notification_type)
+
+    def handle_event(self, event_type, message, count=1):
         if event_type == "vehicle_detected":
-            self.show_notification(f"🚗 {message}", "success")
+            self.show_event_notification(f"🚗 {message}", "success", count)
             self.update_gate_status("Vehicle Detected - Gate Opening")
         elif event_type == "gate_command":
-            self.show_notification(f"🚪 {message}", "info")
+            self.show_event_notification(f"🚪 {message}", "info", count)
         elif event_type == "gate_status":
             self.update_gate_status(f"Gate: {message}")
             if message.upper() in ["OPEN", "OPENED"]:
-                self.show_notification("🟢 Gate Opened", "success")
+                self.show_event_notification("🟢 Gate Opened", "success", count)
             elif message.upper() in ["CLOSED", "CLOSE"]:
-                self.show_notification("🔴 Gate Closed", "warning")
+                self.show_event_notification("🔴 Gate Closed", "warning", count)
         elif event_type == "gate_control":
             if message.upper() == "OPEN":
-                self.show_notification("📤 Gate Open Command Received", "info")
+                self.show_event_notification("📤 Gate Open Command Received", "info", count)
+        elif event_type == "slot_disagreement":
+            self.show_event_notification(f"⚠️ {message}", "warning", count)
+        elif event_type == "lot_full":
+            self.show_event_notification(f"🅿️ {message}", "error", count)
+            self.update_gate_status("Entry Refused - Lot Full")
 
     def show_notification(self, message, notification_type="info"):
-        notification = tk.Frame(self.main_content, bg="#1e293b", relief="solid", bd=1)
-        notification.place(relx=0.02, rely=0.02, relwidth=0.4)
-        
-        colors = {
-            "success": "#10b981",
-            "warning": "#f59e0b", 
-            "error": "#ef4444",
-            "info": "#3b82f6"
-        }
-        
-        color = colors.get(notification_type, "#3b82f6")
-        
-        tk.Label(notification, text=message, bg="#1e293b", fg=color, 
-                font=("Segoe UI", 11, "bold")).pack(pady=8, padx=10)
-        
-        self.root.after(2000, lambda: notification.destroy())
+        self.toast.show(message, notification_type)
 
     def update_gate_status(self, status):
         self.status_vars["Gate"].set(status)
@@ -371,37 +2396,55 @@ class ParkingSystemGUI:
         self.camera_feed = tk.Label(camera_section, text="Camera Feed Offline\nClick 'Start System' to begin monitoring\n",
                                     bg="#1e293b", fg="gray", font=("Segoe UI", 14))
         self.camera_feed.pack(fill="both", expand=True, pady=20)
+        self.renderer = DisplayRenderer(self.camera_feed)
 
         self.status_panel = tk.Frame(self.sidebar, bg="#1e293b", bd=1, relief="solid")
         self.status_panel.pack(fill="x", padx=10, pady=(0, 20))
         ttk.Label(self.status_panel, text="📊 System Status", style="Title.TLabel").pack(pady=10)
         self.status_grid = tk.Frame(self.status_panel, bg="#1e293b")
         self.status_grid.pack(fill="x", padx=10, pady=5)
-        status_labels = ["Camera", "MQTT", "Database", "Gate", "Total Detections"]
+        status_labels = ["Detector", "OCR", "Camera", "MQTT", "Database", "DB Queue", "Gate", "Total Detections", "Slots"]
+        counter_labels = ["DB Queue", "Total Detections"]
+        readiness_labels = ["Detector", "OCR"]
         self.status_vars = {}
         self.status_labels_widgets = {}
         for i, label in enumerate(status_labels):
             ttk.Label(self.status_grid, text=label).grid(row=i, column=0, sticky="w", padx=5, pady=5)
-            var = tk.StringVar(value="Disconnected" if label != "Total Detections" else "0")
+            var = tk.StringVar(value="0" if label in counter_labels else ("Loading" if label in readiness_labels else "Disconnected"))
             self.status_vars[label] = var
             status_label = ttk.Label(self.status_grid, textvariable=var, style="Status.TLabel")
             status_label.grid(row=i, column=1, sticky="e", padx=5, pady=5)
             self.status_labels_widgets[label] = status_label
-            if label != "Total Detections":
+            if label not in counter_labels:
                 status_label.configure(foreground="#ef4444")
             self.status_grid.grid_columnconfigure(1, weight=1)
 
+        self.metrics_panel = tk.Frame(self.sidebar, bg="#1e293b", bd=1, relief="solid")
+        self.metrics_panel.pack(fill="x", padx=10, pady=(0, 20))
+        ttk.Label(self.metrics_panel, text="⏱ Performance", style="Title.TLabel").pack(pady=10)
+        metrics_grid = tk.Frame(self.metrics_panel, bg="#1e293b")
+        metrics_grid.pack(fill="x", padx=10, pady=5)
+        self.metric_vars = {}
+        for i, label in enumerate(["FPS", "Capture p95", "YOLO p95", "OCR p95", "DB p95", "MQTT p95", "Render p95", "Queues", "Dropped"]):
+            ttk.Label(metrics_grid, text=label).grid(row=i, column=0, sticky="w", padx=5, pady=2)
+            var = tk.StringVar(value="-")
+            self.metric_vars[label] = var
+            ttk.Label(metrics_grid, textvariable=var, style="Status.TLabel").grid(row=i, column=1, sticky="e", padx=5, pady=2)
+        metrics_grid.grid_columnconfigure(1, weight=1)
+
         self.vehicle_panel = tk.Frame(self.sidebar, bg="#1e293b", bd=1, relief="solid")
         self.vehicle_panel.pack(fill="both", expand=True, padx=10)
         ttk.Label(self.vehicle_panel, text="🚘 Vehicle Detections", style="Title.TLabel").pack(pady=10)
+        search_frame = tk.Frame(self.vehicle_panel, bg="#1e293b")
+        search_frame.pack(fill="x", padx=10)
+        ttk.Label(search_frame, text="Search", background="#1e293b").pack(side="left")
+        self.log_query = tk.StringVar()
+        ttk.Entry(search_frame, textvariable=self.log_query).pack(side="left", fill="x", expand=True, padx=(8, 0))
         self.vehicle_log = tk.Frame(self.vehicle_panel, bg="#1e293b")
         self.vehicle_log.pack(fill="both", expand=True, padx=10, pady=5)
-        scrollbar = tk.Scrollbar(self.vehicle_log)
-        scrollbar.pack(side="right", fill="y")
-        self.vehicle_log_text = tk.Text(self.vehicle_log, bg="#1e293b", fg="white", font=("Segoe UI", 10),
-                                        yscrollcommand=scrollbar.set, state="disabled")
-        self.vehicle_log_text.pack(fill="both", expand=True)
-        scrollbar.config(command=self.vehicle_log_text.yview)
+        self.detection_log = DetectionLog()
+        self.log_view = DetectionLogView(self.vehicle_log, self.detection_log)
+        self.log_query.trace_add("write", lambda *args: self.log_view.set_filter(self.log_query.get()))
 
         self.footer = tk.Frame(self.container, bg="#1e293b", bd=1, relief="solid")
         self.footer.grid(row=2, column=0, columnspan=2, sticky="ew", pady=(20, 0))
@@ -415,48 +2458,102 @@ class ParkingSystemGUI:
         ttk.Label(footer_left, textvariable=self.socket_status).pack(side="left")
         tk.Label(self.footer, text="Entry Monitoring System", bg="#1e293b", fg="white").pack(side="right", padx=30)
 
+        self.toast = Toast(self.main_content)
         self.update_time()
         self.update_indicators()
+        self.process_events()
+        self.update_metrics()
+        self.root.after(int(METRICS_PUBLISH_INTERVAL * 1000), self.publish_metrics)
 
     def update_time(self):
         self.system_time.set(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
         self.status_vars["MQTT"].set(self.speed_estimator.mqtt_status)
+
+        for label, state in self.speed_estimator.readiness.items():
+            self.status_vars[label].set(state)
+            if state == "Ready":
+                self.status_labels_widgets[label].configure(foreground="#10b981")
+            elif state.startswith("Error"):
+                self.status_labels_widgets[label].configure(foreground="#ef4444")
+            else:
+                self.status_labels_widgets[label].configure(foreground="#f59e0b")
         
-        if self.speed_estimator.db_connection is not None:
+        db_writer = self.speed_estimator.db_writer
+        self.status_vars["DB Queue"].set(str(db_writer.depth()) if db_writer is not None else "0")
+        if db_writer is None:
+            self.status_vars["Database"].set("Disabled")
+            self.status_labels_widgets["Database"].configure(foreground="#ef4444")
+        elif db_writer.connected:
             self.status_vars["Database"].set("Connected")
             self.status_labels_widgets["Database"].configure(foreground="#10b981")
+        elif db_writer.connect_attempts == 0:
+            self.status_vars["Database"].set("Connecting")
+            self.status_labels_widgets["Database"].configure(foreground="#f59e0b")
         else:
-            self.status_vars["Database"].set("Disconnected")
+            self.status_vars["Database"].set("Spooling" if db_writer.spool_pending else "Disconnected")
             self.status_labels_widgets["Database"].configure(foreground="#ef4444")
         
         if self.speed_estimator.mqtt_status == "Connected":
             self.status_labels_widgets["MQTT"].configure(foreground="#10b981")
+        elif self.speed_estimator.mqtt_status == "Connecting":
+            self.status_labels_widgets["MQTT"].configure(foreground="#f59e0b")
         else:
             self.status_labels_widgets["MQTT"].configure(foreground="#ef4444")
         
-        if self.status_vars["Camera"].get() == "Connected":
+        occupancy = self.speed_estimator.occupancy
+        if occupancy.known:
+            counts = occupancy.counts()
+            flagged = self.speed_estimator.flagged_slots
+            self.status_vars["Slots"].set(f"{counts['available']}/{counts['slots']} free" + (f", {counts['reserved']} reserved" if counts['reserved'] else "")
+                                          + (f", {len(flagged)} mismatched" if flagged else ""))
+            self.status_labels_widgets["Slots"].configure(foreground="#ef4444" if not counts['available'] else ("#f59e0b" if flagged else "#10b981"))
+
+        if self.status_vars["Camera"].get().startswith("Connected"):
             self.status_labels_widgets["Camera"].configure(foreground="#10b981")
         else:
             self.status_labels_widgets["Camera"].configure(foreground="#ef4444")
         
         self.root.after(1000, self.update_time)
 
+    def update_metrics(self):
+        snapshot = self.speed_estimator.metrics.snapshot()
+        stages, gauges = snapshot['stages'], snapshot['gauges']
+        now, frames = snapshot['timestamp'], snapshot['counters'].get("frames_processed", 0)
+        last_time, last_frames = self.last_fps_sample
+        self.last_fps_sample = (now, frames)
+        self.metric_vars["FPS"].set(f"{(frames - last_frames) / max(now - last_time, 1e-6):.1f}")
+        for label, stage in [("Capture p95", "capture"), ("YOLO p95", "track"), ("OCR p95", "ocr"),
+                             ("DB p95", "db_write"), ("MQTT p95", "mqtt_delivery"), ("Render p95", "render")]:
+            self.metric_vars[label].set(f"{stages[stage]['p95_ms']:.1f} ms" if stage in stages else "-")
+        queues = [gauges.get(name) for name in ("capture_queue", "display_queue", "ocr_queue", "db_queue")]
+        self.metric_vars["Queues"].set("/".join("-" if depth is None else str(depth) for depth in queues))
+        self.metric_vars["Dropped"].set(str(gauges.get("dropped_frames") or 0))
+        self.root.after(1000, self.update_metrics)
+
+    def publish_metrics(self):
+        self.speed_estimator.publish_metrics()
+        self.root.after(int(METRICS_PUBLISH_INTERVAL * 1000), self.publish_metrics)
+
     def update_indicators(self):
         self.camera_indicator.configure(foreground="#10b981" if self.is_running else "#ef4444")
         self.socket_indicator.configure(foreground="#10b981" if self.speed_estimator.mqtt_status == "Connected" else "#ef4444")
         self.root.after(2000, self.update_indicators)
 
     def start_camera(self):
-        if self.cap is None:
-            for index in [0]:
-                self.cap = cv2.VideoCapture(index)
-                if self.cap.isOpened():
-                    break
-            if not self.cap.isOpened():
+        if not self.captures:
+            for config in CAMERA_SOURCES:
+                capture = open_source(config['source'])
+                if capture is None:
+                    print(f"Could not open camera '{config['name']}': {config['source']}")
+                    continue
+                self.captures[config['name']] = capture
+            if not self.captures:
                 self.status_vars["Camera"].set("Disconnected")
-                self.cap = None
                 return
-            self.status_vars["Camera"].set("Connected")
+            opened = len(self.captures)
+            self.status_vars["Camera"].set("Connected" if opened == len(CAMERA_SOURCES) else f"Connected ({opened}/{len(CAMERA_SOURCES)})")
+        self.pipeline = FramePipeline(self.captures, self.speed_estimator)
+        self.pipeline.start()
         self.is_running = True
         self.start_btn.configure(state="disabled")
         self.stop_btn.configure(state="normal")
@@ -465,44 +2562,49 @@ class ParkingSystemGUI:
 
     def stop_camera(self):
         self.is_running = False
-        if self.cap is not None:
-            self.cap.release()
-            self.cap = None
+        if self.pipeline is not None:
+            self.pipeline.stop()
+            self.pipeline = None
+        for cap, _ in self.captures.values():
+            cap.release()
+        self.captures = {}
         self.status_vars["Camera"].set("Disconnected")
         self.start_btn.configure(state="normal")
         self.stop_btn.configure(state="disabled")
         self.camera_feed.configure(image='', text="Camera Feed Offline", fg="gray")
+        self.renderer.reset()
         self.speed_estimator.cleanup()
 
     def update_frame(self):
-        if self.is_running and self.cap is not None:
-            ret, frame = self.cap.read()
-            if ret:
-                frame = cv2.resize(frame, (1020, 500))
-                processed_frame = self.speed_estimator.estimate_speed(frame)
-                img = cv2.cvtColor(processed_frame, cv2.COLOR_BGR2RGB)
-                img = Image.fromarray(img)
-                imgtk = ImageTk.PhotoImage(image=img)
-                self.camera_feed.imgtk = imgtk
-                self.camera_feed.configure(image=imgtk)
-                self.status_vars["Total Detections"].set(str(self.speed_estimator.detection_counter))
-                
-                if self.speed_estimator.new_detections:
-                    self.vehicle_log_text.configure(state="normal")
-                    for detection in self.speed_estimator.new_detections:
-                        log_text = f"#{detection.get('detection_count', 'N/A')} {detection['time']} - ID: {detection['track_id']}, Type: {detection['vehicle_type']}, Plate: {detection['numberplate']}, Speed: {detection['speed']} km/h, Gate: {detection.get('gate_status', 'N/A')}\n"
-                        self.vehicle_log_text.insert(tk.END, log_text)
-                    self.vehicle_log_text.configure(state="disabled")
-                    self.vehicle_log_text.see(tk.END)
-                    self.speed_estimator.new_detections.clear()
-                    
-            self.root.after(10, self.update_frame)
+        if self.is_running and self.pipeline is not None:
+            tick_start = time()
+            processed_frame = self.pipeline.latest_frame()
+            if processed_frame is not None:
+                with self.speed_estimator.metrics.timer("render"):
+                    self.renderer.render(processed_frame)
+            self.status_vars["Total Detections"].set(str(self.speed_estimator.detection_counter))
+
+            # Everything that arrived since the last tick goes into the log model, then the view redraws once
+            if self.speed_estimator.new_detections:
+                while self.speed_estimator.new_detections:
+                    detection = self.speed_estimator.new_detections.popleft()
+                    camera = f"[{detection.get('stream')}] " if len(self.speed_estimator.streams) > 1 else ""
+                    log_text = f"{camera}#{detection.get('detection_count', 'N/A')} {detection['time']} - ID: {detection['track_id']}, Type: {detection['vehicle_type']}, Plate: {detection['numberplate']}, Speed: {detection['speed']} km/h, Gate: {detection.get('gate_status', 'N/A')}"
+                    seq = self.detection_log.append(log_text, detection['numberplate'], int(detection['track_id']))
+                    self.log_view.added(seq)
+                self.log_view.refresh()
+
+            elapsed_ms = int((time() - tick_start) * 1000)
+            self.root.after(max(1, int(1000 / DISPLAY_FPS) - elapsed_ms), self.update_frame)
 
     def run(self):
         try:
             self.root.mainloop()
         finally:
+            if self.metrics_server is not None:
+                self.metrics_server.shutdown()
             self.speed_estimator.cleanup()
+            self.speed_estimator.shutdown()
 
 if __name__ == "__main__":
     gui = ParkingSystemGUI()
@@ -0,0 +1,199 @@
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+
+import cv2
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv", ".m4v", ".webm")
+RESULT_FIELDS = ["source", "segment", "frame", "video_time", "event", "track_id", "vehicle_type",
+                 "speed", "numberplate", "detection_count"]
+
+estimator = None
+scheduler = None
+
+def collect_videos(inputs):
+    videos = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                videos.extend(os.path.join(root, name) for name in sorted(files) if name.lower().endswith(VIDEO_EXTENSIONS))
+        elif os.path.isfile(path):
+            videos.append(path)
+        else:
+            print(f"Skipping missing input: {path}", file=sys.stderr)
+    return sorted(videos)
+
+def plan_segments(videos, segment_seconds):
+    tasks = []
+    for path in videos:
+        if not segment_seconds:
+            tasks.append((path, 0, 0, None))
+            continue
+        cap = cv2.VideoCapture(path)
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+        if frame_count <= 0:
+            tasks.append((path, 0, 0, None))
+            continue
+        step = max(1, int(segment_seconds * fps))
+        for segment, start in enumerate(range(0, frame_count, step)):
+            tasks.append((path, segment, start, min(start + step, frame_count)))
+    return tasks
+
+def init_worker(model_path, backend, int8, ocr_workers, threads, motion_gate):
+    global estimator, scheduler
+    cv2.setNumThreads(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    from Gui import SpeedEstimator, InferenceScheduler
+    estimator = SpeedEstimator(model_path=model_path, enable_mqtt=False, enable_db=False, ocr_workers=ocr_workers,
+                               backend=backend, int8=int8)
+    scheduler = InferenceScheduler(estimator) if motion_gate else None
+
+def drain_records(path, segment, frame, video_time):
+    records = []
+    while estimator.new_detections:
+        detection = estimator.new_detections.popleft()
+        records.append({
+            "source": path,
+            "segment": segment,
+            "frame": frame,
+            "video_time": round(video_time, 3),
+            "event": detection.get("event"),
+            "track_id": int(detection["track_id"]),
+            "vehicle_type": detection["vehicle_type"],
+            "speed": float(detection["speed"]),
+            "numberplate": detection["numberplate"],
+            "detection_count": detection["detection_count"] if isinstance(detection["detection_count"], int) else None
+        })
+    return records
+
+def process_segment(task, frame_size):
+    # Tracker state is reset per task, so a vehicle spanning a segment boundary is reported once per segment
+    path, segment, start, end = task
+    if not estimator.ocr_pool.available:
+        raise RuntimeError(f"OCR engine unavailable: {estimator.ocr_pool.error}")
+    estimator.reset_tracking()
+    estimator.new_detections.clear()
+    cap = cv2.VideoCapture(path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    if start:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    records = []
+    frame_index = start
+    while end is None or frame_index < end:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        video_time = frame_index / fps
+        frame = cv2.resize(frame, frame_size)
+        if scheduler is not None:
+            scheduler.process(frame, timestamp=video_time)
+        else:
+            estimator.estimate_speed(frame, timestamp=video_time)
+        records.extend(drain_records(path, segment, frame_index, video_time))
+        frame_index += 1
+    cap.release()
+    if not estimator.flush_tracks():
+        raise RuntimeError("OCR did not finish")
+    records.extend(drain_records(path, segment, frame_index, frame_index / fps))
+    return path, segment, frame_index - start, records
+
+class JsonlSink:
+    def __init__(self, path):
+        self.file = sys.stdout if path == "-" else open(path, "w")
+
+    def write(self, records):
+        for record in records:
+            self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+class ParquetSink:
+    def __init__(self, path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Parquet output requires pyarrow: pip install pyarrow")
+        self.pa = pa
+        self.schema = pa.schema([
+            ("source", pa.string()), ("segment", pa.int32()), ("frame", pa.int64()), ("video_time", pa.float64()),
+            ("event", pa.string()), ("track_id", pa.int64()), ("vehicle_type", pa.string()),
+            ("speed", pa.float64()), ("numberplate", pa.string()), ("detection_count", pa.int64())
+        ])
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, records):
+        if records:
+            columns = {field: [record[field] for record in records] for field in RESULT_FIELDS}
+            self.writer.write_table(self.pa.Table.from_pydict(columns, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+def parse_frame_size(value):
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the entry-gate detection, tracking and OCR pipeline over recorded video without the GUI, MQTT or MongoDB.")
+    parser.add_argument("inputs", nargs="+", help="video files or directories (searched recursively)")
+    parser.add_argument("-o", "--output", default="-", help="results file; .parquet writes Parquet, anything else JSONL ('-' for stdout)")
+    parser.add_argument("-j", "--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2), help="worker processes")
+    parser.add_argument("--segment-seconds", type=float, default=0, help="split each video into segments of this length (0 = one task per file)")
+    parser.add_argument("--model", default="yolov8m.pt", help="YOLO weights")
+    parser.add_argument("--backend", default="pytorch", choices=["pytorch", "onnx", "openvino"], help="inference runtime for the detector")
+    parser.add_argument("--int8", action="store_true", help="use the INT8-quantized export (onnx/openvino only)")
+    parser.add_argument("--ocr-workers", type=int, default=1, help="OCR threads per worker process")
+    parser.add_argument("--threads", type=int, default=1, help="torch/OpenCV threads per worker process")
+    parser.add_argument("--motion-gate", action="store_true", help="skip YOLO on static, empty stretches of footage")
+    parser.add_argument("--frame-size", type=parse_frame_size, default=(1020, 500), help="frame size the pipeline runs at, WxH (entry line coordinates assume 1020x500)")
+    args = parser.parse_args(argv)
+
+    videos = collect_videos(args.inputs)
+    if not videos:
+        parser.error("no video files found")
+    tasks = plan_segments(videos, args.segment_seconds)
+    if args.backend != "pytorch":
+        # Export once up front so the workers do not race to write the same file
+        from Gui import export_model
+        export_model(args.model, args.backend, args.int8)
+    sink = ParquetSink(args.output) if args.output.endswith(".parquet") else JsonlSink(args.output)
+    print(f"Processing {len(videos)} videos as {len(tasks)} tasks on {args.workers} workers", file=sys.stderr)
+
+    total_frames = 0
+    failed = 0
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=init_worker, initargs=(args.model, args.backend, args.int8, args.ocr_workers, args.threads, args.motion_gate)) as pool:
+            futures = {pool.submit(process_segment, task, args.frame_size): task for task in tasks}
+            for future in as_completed(futures):
+                try:
+                    path, segment, frames, records = future.result()
+                except Exception as err:
+                    # One bad segment (or worker) should not sink the whole run
+                    path, segment = futures[future][:2]
+                    failed += 1
+                    print(f"{path} [segment {segment}]: failed: {err}", file=sys.stderr)
+                    continue
+                total_frames += frames
+                sink.write(records)
+                print(f"{path} [segment {segment}]: {frames} frames, {len(records)} records", file=sys.stderr)
+    finally:
+        sink.close()
+    print(f"Done: {total_frames} frames" + (f", {failed} of {len(tasks)} segments failed" if failed else ""), file=sys.stderr)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
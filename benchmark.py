@@ -0,0 +1,325 @@
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+from functools import wraps
+from time import perf_counter, sleep
+
+import cv2
+import numpy as np
+
+from Gui import SpeedEstimator, MongoBatchWriter, MQTTPublisher, DisplayRenderer
+
+STAGES = ["capture", "frame", "track", "localize", "preprocess", "ocr", "db_insert", "mqtt_publish", "mqtt_send", "render"]
+
+class StubMQTTMessageInfo:
+    def __init__(self, rc=0):
+        self.rc = rc
+
+    def wait_for_publish(self, timeout=None):
+        return True
+
+    def is_published(self):
+        return self.rc == 0
+
+class StubMQTTClient:
+    # Broker stand-in for MQTTPublisher; fail_every drops the connection on every Nth publish to simulate hiccups
+    def __init__(self, latency=0.0, fail_every=0):
+        self.latency = latency
+        self.fail_every = fail_every
+        self.published = []
+        self.attempts = 0
+        self.connects = 0
+        self.connected = False
+        self.on_connect = None
+        self.on_disconnect = None
+        self.on_message = None
+
+    def connect(self, host, port=1883, keepalive=60):
+        self.connected = True
+        self.connects += 1
+        if self.on_connect is not None:
+            self.on_connect(self, None, {}, 0)
+        return 0
+
+    def loop(self, timeout=1.0):
+        if not self.connected:
+            return 4
+        sleep(timeout)
+        return 0
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        if not self.connected:
+            return StubMQTTMessageInfo(4)
+        if self.latency:
+            sleep(self.latency)
+        self.attempts += 1
+        if self.fail_every and self.attempts % self.fail_every == 0:
+            self.connected = False
+            if self.on_disconnect is not None:
+                self.on_disconnect(self, None, 7)
+            return StubMQTTMessageInfo(7)
+        self.published.append((topic, payload, qos, retain))
+        return StubMQTTMessageInfo()
+
+    def subscribe(self, topic, qos=0):
+        return 0, 0
+
+    def disconnect(self):
+        self.connected = False
+
+class InMemoryCollection:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.documents = []
+
+    def insert_one(self, document):
+        if self.latency:
+            sleep(self.latency)
+        self.documents.append(dict(document))
+
+    def insert_many(self, documents):
+        if self.latency:
+            sleep(self.latency)
+        self.documents.extend(dict(document) for document in documents)
+
+class StageRecorder:
+    def __init__(self):
+        self.samples = {stage: [] for stage in STAGES}
+        self.lock = threading.Lock()
+        self.enabled = False
+
+    def record(self, stage, seconds):
+        if self.enabled:
+            with self.lock:
+                self.samples.setdefault(stage, []).append(seconds * 1000.0)
+
+    def wrap(self, stage, func):
+        @wraps(func)
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(stage, perf_counter() - start)
+        return timed
+
+    def summary(self):
+        stats = {}
+        with self.lock:
+            for stage, samples in self.samples.items():
+                if not samples:
+                    continue
+                values = np.asarray(samples)
+                stats[stage] = {
+                    "count": len(values),
+                    "mean_ms": round(float(values.mean()), 3),
+                    "p50_ms": round(float(np.percentile(values, 50)), 3),
+                    "p95_ms": round(float(np.percentile(values, 95)), 3),
+                    "p99_ms": round(float(np.percentile(values, 99)), 3),
+                    "max_ms": round(float(values.max()), 3)
+                }
+        return stats
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+def synthetic_frames(count, size, vehicles, seed=0):
+    rng = np.random.default_rng(seed)
+    width, height = size
+    background = np.full((height, width, 3), 90, dtype=np.uint8)
+    cv2.rectangle(background, (0, int(height * 0.45)), (width, height), (60, 60, 60), -1)
+    starts = rng.integers(0, width, size=vehicles)
+    lanes = rng.integers(int(height * 0.5), height - 90, size=vehicles)
+    velocities = rng.integers(4, 14, size=vehicles)
+    for index in range(count):
+        frame = background.copy()
+        for start, lane, velocity in zip(starts, lanes, velocities):
+            x = int((start + velocity * index) % (width + 200)) - 200
+            cv2.rectangle(frame, (x, lane), (x + 180, lane + 80), (30, 30, 200), -1)
+            cv2.rectangle(frame, (x + 60, lane + 55), (x + 120, lane + 72), (240, 240, 240), -1)
+        yield frame
+
+def video_frames(path, count, size):
+    cap = cv2.VideoCapture(path)
+    produced = 0
+    while produced < count:
+        ret, frame = cap.read()
+        if not ret:
+            if produced == 0:
+                break
+            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            continue
+        produced += 1
+        yield cv2.resize(frame, size)
+    cap.release()
+
+def build_estimator(args, recorder, spool_path):
+    estimator = SpeedEstimator(model_path=args.model, enable_mqtt=False, enable_db=False, ocr_workers=args.ocr_workers,
+                               backend=args.backend, int8=args.int8)
+    # Localizers are created inside the OCR workers, so each worker's own instance is wrapped on its first job
+    recognize = estimator.ocr_pool.recognize
+
+    def recognize_timed(engine, roi):
+        localizer = engine[1]
+        if "locate" not in vars(localizer):
+            localizer.locate = recorder.wrap("localize", localizer.locate)
+        return recognize(engine, roi)
+    estimator.ocr_pool.recognize = recognize_timed
+    # mqtt_publish is what the detection loop pays (enqueue); mqtt_send is the broker round trip on the publisher thread
+    mqtt_client = StubMQTTClient(latency=args.mqtt_latency / 1000.0, fail_every=args.mqtt_fail_every)
+    mqtt_client.publish = recorder.wrap("mqtt_send", mqtt_client.publish)
+    publisher = MQTTPublisher(lambda: mqtt_client, backoff_initial=0.05, backoff_max=0.5, metrics=estimator.metrics)
+    publisher.publish = recorder.wrap("mqtt_publish", publisher.publish)
+    estimator.mqtt_client = publisher
+    estimator.enable_mqtt = True
+    collection = InMemoryCollection(latency=args.db_latency / 1000.0)
+    collection.insert_many = recorder.wrap("db_insert", collection.insert_many)
+    estimator.db_writer = MongoBatchWriter(lambda: collection, spool_path=spool_path)
+    estimator.model.track = recorder.wrap("track", estimator.model.track)
+    estimator.preprocess_roi = recorder.wrap("preprocess", estimator.preprocess_roi)
+    estimator.perform_ocr = recorder.wrap("ocr", estimator.perform_ocr)
+    return estimator, collection, mqtt_client
+
+def run(args):
+    recorder = StageRecorder()
+    spool_path = os.path.join(tempfile.mkdtemp(prefix="bench_"), "spool.jsonl")
+    estimator, collection, mqtt_client = build_estimator(args, recorder, spool_path)
+    size = (args.width, args.height)
+    renderer = DisplayRenderer(fallback_size=size)
+    if args.tk:
+        import tkinter as tk
+        root = tk.Tk()
+        root.withdraw()
+        renderer = DisplayRenderer(tk.Label(root), fallback_size=size)
+    total = args.warmup + args.frames
+    frames = video_frames(args.video, total, size) if args.video else synthetic_frames(total, size, args.vehicles)
+    timed_render = recorder.wrap("render", renderer.render)
+
+    memory = {}
+    processed = 0
+    started = None
+    iterator = iter(frames)
+    while True:
+        capture_start = perf_counter()
+        frame = next(iterator, None)
+        if frame is None:
+            break
+        if processed == args.warmup:
+            estimator.ocr_pool.wait_idle()
+            memory["after_warmup_mb"] = round(rss_mb(), 1)
+            recorder.enabled = True
+            started = perf_counter()
+        recorder.record("capture", perf_counter() - capture_start)
+        frame_start = perf_counter()
+        processed_frame = estimator.estimate_speed(frame)
+        recorder.record("frame", perf_counter() - frame_start)
+        timed_render(processed_frame)
+        estimator.new_detections.clear()
+        processed += 1
+    if started is None:
+        raise SystemExit("not enough frames for the requested warm-up")
+    elapsed = perf_counter() - started
+    estimator.flush_tracks()
+    estimator.shutdown()
+    memory["end_mb"] = round(rss_mb(), 1)
+    memory["growth_mb"] = round(memory["end_mb"] - memory["after_warmup_mb"], 1)
+    measured = processed - args.warmup
+    return {
+        "config": {
+            "source": args.video or f"synthetic:{args.vehicles}",
+            "frames": measured,
+            "size": f"{args.width}x{args.height}",
+            "model": args.model,
+            "backend": args.backend + (":int8" if args.int8 else ""),
+            "ocr_workers": args.ocr_workers
+        },
+        "fps": round(measured / elapsed, 2) if elapsed > 0 else 0.0,
+        "stages": recorder.summary(),
+        "memory": memory,
+        "records": {"db_documents": len(collection.documents), "mqtt_messages": len(mqtt_client.published),
+                    "mqtt_reconnects": mqtt_client.connects - 1}
+    }
+
+def print_report(report):
+    config = report["config"]
+    print(f"Source: {config['source']}  frames: {config['frames']}  size: {config['size']}  model: {config['model']} ({config.get('backend', 'pytorch')})")
+    print(f"{'stage':<14}{'count':>8}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)")
+    for stage in STAGES:
+        stats = report["stages"].get(stage)
+        if stats:
+            print(f"{stage:<14}{stats['count']:>8}{stats['mean_ms']:>10.2f}{stats['p50_ms']:>10.2f}"
+                  f"{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}{stats['max_ms']:>10.2f}")
+    memory = report["memory"]
+    print(f"FPS: {report['fps']}  RSS: {memory['after_warmup_mb']} -> {memory['end_mb']} MB ({memory['growth_mb']:+} MB)")
+    records = report["records"]
+    print(f"DB documents: {records['db_documents']}  MQTT messages: {records['mqtt_messages']}"
+          f" (reconnects: {records.get('mqtt_reconnects', 0)})")
+
+def compare(report, baseline, tolerance, min_delta_ms):
+    regressions = []
+    print(f"\nComparison against baseline (tolerance {tolerance:.0%}):")
+    for stage in STAGES:
+        current = report["stages"].get(stage)
+        previous = baseline["stages"].get(stage)
+        if not current or not previous or previous["p95_ms"] <= 0:
+            continue
+        change = current["p95_ms"] / previous["p95_ms"] - 1
+        regressed = change > tolerance and current["p95_ms"] - previous["p95_ms"] > min_delta_ms
+        flag = "REGRESSION" if regressed else ""
+        print(f"  {stage:<14} p95 {previous['p95_ms']:>9.2f} -> {current['p95_ms']:>9.2f} ms ({change:+.1%}) {flag}")
+        if flag:
+            regressions.append(stage)
+    if baseline["fps"] > 0:
+        change = report["fps"] / baseline["fps"] - 1
+        flag = "REGRESSION" if change < -tolerance else ""
+        print(f"  {'fps':<14}     {baseline['fps']:>9.2f} -> {report['fps']:>9.2f}    ({change:+.1%}) {flag}")
+        if flag:
+            regressions.append("fps")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the SpeedEstimator hot path per stage with in-process MQTT and MongoDB stand-ins.")
+    parser.add_argument("--video", help="recorded video to replay (default: synthetic frames)")
+    parser.add_argument("--frames", type=int, default=300, help="measured frames")
+    parser.add_argument("--warmup", type=int, default=20, help="frames run before measuring")
+    parser.add_argument("--vehicles", type=int, default=3, help="moving objects in synthetic frames")
+    parser.add_argument("--width", type=int, default=1020)
+    parser.add_argument("--height", type=int, default=500)
+    parser.add_argument("--model", default="yolov8m.pt")
+    parser.add_argument("--backend", default="pytorch", choices=["pytorch", "onnx", "openvino"])
+    parser.add_argument("--int8", action="store_true", help="use the INT8-quantized export (onnx/openvino only)")
+    parser.add_argument("--ocr-workers", type=int, default=2)
+    parser.add_argument("--db-latency", type=float, default=0.0, help="simulated insert latency in ms")
+    parser.add_argument("--mqtt-latency", type=float, default=0.0, help="simulated publish latency in ms")
+    parser.add_argument("--mqtt-fail-every", type=int, default=0, help="drop the broker connection on every Nth publish")
+    parser.add_argument("--tk", action="store_true", help="include the Tk PhotoImage paste in the render stage (needs a display)")
+    parser.add_argument("--json", help="write the full report to this file")
+    parser.add_argument("--save-baseline", help="write the report as a baseline file")
+    parser.add_argument("--baseline", help="compare against a baseline file and exit non-zero on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative p95/FPS regression")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5, help="ignore p95 changes smaller than this")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    print_report(report)
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, "w") as output:
+                json.dump(report, output, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(report, json.load(baseline_file), args.tolerance, args.min_delta_ms)
+        if regressions:
+            print(f"Regressions in: {', '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import argparse
+import json
+import sys
+from time import perf_counter
+
+import numpy as np
+
+from Gui import load_detector, INFERENCE_IMGSZ, CAMERA_SOURCES
+from benchmark import synthetic_frames, video_frames
+
+CLASSES = [2, 3, 5, 7]
+
+def parse_variant(value):
+    # model[:backend[:int8]], e.g. yolov8n.pt:openvino:int8
+    parts = value.split(":")
+    model_path = parts[0]
+    backend = parts[1] if len(parts) > 1 else "pytorch"
+    int8 = len(parts) > 2 and parts[2] == "int8"
+    return model_path, backend, int8
+
+def variant_name(model_path, backend, int8):
+    return f"{model_path}:{backend}" + (":int8" if int8 else "")
+
+def detect(model, frames, imgsz):
+    detections = []
+    timings = []
+    for frame in frames:
+        start = perf_counter()
+        result = model.predict(frame, conf=0.25, iou=0.45, classes=CLASSES, imgsz=imgsz, verbose=False)[0]
+        timings.append(perf_counter() - start)
+        boxes = result.boxes
+        detections.append((boxes.xyxy.cpu().numpy(), boxes.cls.cpu().numpy().astype(int), boxes.conf.cpu().numpy()))
+    return detections, np.asarray(timings)
+
+def detect_batched(model, frames, imgsz, batch):
+    # Same detections as detect(), but batch frames per predict call, as estimate_batch does with several cameras
+    detections = []
+    timings = []
+    for first in range(0, len(frames), batch):
+        chunk = frames[first:first + batch]
+        start = perf_counter()
+        results = model.predict(chunk, conf=0.25, iou=0.45, classes=CLASSES, imgsz=imgsz, verbose=False)
+        timings.append((perf_counter() - start) / len(chunk))
+        for result in results:
+            boxes = result.boxes
+            detections.append((boxes.xyxy.cpu().numpy(), boxes.cls.cpu().numpy().astype(int), boxes.conf.cpu().numpy()))
+    return detections, np.asarray(timings)
+
+def box_iou(a, b):
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    intersection = np.clip(bottom_right - top_left, 0, None).prod(axis=2)
+    area_a = (a[:, 2:] - a[:, :2]).prod(axis=1)
+    area_b = (b[:, 2:] - b[:, :2]).prod(axis=1)
+    return intersection / (area_a[:, None] + area_b[None, :] - intersection + 1e-9)
+
+def parity(reference, candidate, iou_threshold):
+    # Greedy one-to-one matching per frame on IoU within the same class
+    matched = reference_total = candidate_total = 0
+    ious, confidence_deltas = [], []
+    for (ref_boxes, ref_classes, ref_conf), (boxes, classes, conf) in zip(reference, candidate):
+        reference_total += len(ref_boxes)
+        candidate_total += len(boxes)
+        if not len(ref_boxes) or not len(boxes):
+            continue
+        overlap = box_iou(ref_boxes, boxes)
+        overlap[ref_classes[:, None] != classes[None, :]] = 0
+        while True:
+            i, j = np.unravel_index(np.argmax(overlap), overlap.shape)
+            if overlap[i, j] < iou_threshold:
+                break
+            matched += 1
+            ious.append(overlap[i, j])
+            confidence_deltas.append(abs(ref_conf[i] - conf[j]))
+            overlap[i, :] = 0
+            overlap[:, j] = 0
+    return {
+        "recall": round(matched / reference_total, 4) if reference_total else 1.0,
+        "precision": round(matched / candidate_total, 4) if candidate_total else 1.0,
+        "mean_iou": round(float(np.mean(ious)), 4) if ious else None,
+        "mean_conf_delta": round(float(np.mean(confidence_deltas)), 4) if confidence_deltas else None
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare detector backends against the PyTorch reference for accuracy parity and CPU throughput.")
+    parser.add_argument("variants", nargs="+", help="model[:backend[:int8]] to compare, e.g. yolov8m.pt:onnx yolov8n.pt:openvino:int8")
+    parser.add_argument("--reference", default="yolov8m.pt", help="PyTorch weights the candidates are checked against")
+    parser.add_argument("--video", help="recorded video to run (default: synthetic frames)")
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--width", type=int, default=1020)
+    parser.add_argument("--height", type=int, default=500)
+    parser.add_argument("--imgsz", type=int, default=INFERENCE_IMGSZ)
+    parser.add_argument("--batch", type=int, default=max(2, len(CAMERA_SOURCES)), help="frames per predict call for the batched check (1 skips it)")
+    parser.add_argument("--iou", type=float, default=0.5, help="IoU for a detection to count as matching the reference")
+    parser.add_argument("--min-recall", type=float, default=0.95, help="parity required for a backend to be recommended")
+    parser.add_argument("--min-precision", type=float, default=0.95)
+    parser.add_argument("--json", help="write the comparison to this file")
+    args = parser.parse_args(argv)
+
+    size = (args.width, args.height)
+    total = args.warmup + args.frames
+    frames = list(video_frames(args.video, total, size) if args.video else synthetic_frames(total, size, 3))
+    if len(frames) <= args.warmup:
+        raise SystemExit("not enough frames for the requested warm-up")
+    warmup, frames = frames[:args.warmup], frames[args.warmup:]
+
+    variants = [(args.reference, "pytorch", False)] + [parse_variant(value) for value in args.variants]
+    reference = None
+    rows = []
+    for model_path, backend, int8 in variants:
+        name = variant_name(model_path, backend, int8)
+        print(f"Running {name}", file=sys.stderr)
+        model = load_detector(model_path, backend, int8, args.imgsz)
+        detect(model, warmup, args.imgsz)
+        detections, timings = detect(model, frames, args.imgsz)
+        row = {
+            "variant": name,
+            "fps": round(len(timings) / timings.sum(), 2),
+            "p50_ms": round(float(np.percentile(timings, 50)) * 1000, 2),
+            "p95_ms": round(float(np.percentile(timings, 95)) * 1000, 2)
+        }
+        if reference is None:
+            reference = detections
+            row.update(recall=1.0, precision=1.0, mean_iou=1.0, mean_conf_delta=0.0)
+        else:
+            row.update(parity(reference, detections, args.iou))
+        row["passes"] = row["recall"] >= args.min_recall and row["precision"] >= args.min_precision
+        if args.batch > 1:
+            # Batched runs are checked against the reference's per-frame detections
+            try:
+                batched, batch_timings = detect_batched(model, frames, args.imgsz, args.batch)
+                batch_parity = parity(reference, batched, args.iou)
+                row.update(batch_fps=round(len(batch_timings) / batch_timings.sum(), 2),
+                           batch_recall=batch_parity["recall"], batch_precision=batch_parity["precision"])
+                row["passes"] = row["passes"] and batch_parity["recall"] >= args.min_recall and batch_parity["precision"] >= args.min_precision
+            except Exception as err:
+                print(f"{name} failed at batch {args.batch}: {err}", file=sys.stderr)
+                row.update(batch_fps=None, batch_recall=None, batch_precision=None, passes=False)
+        rows.append(row)
+
+    batch_header = f"{'b-fps':>8}{'b-rec':>7}{'b-prec':>7}" if args.batch > 1 else ""
+    print(f"{'variant':<36}{'fps':>8}{'p50 ms':>9}{'p95 ms':>9}{'recall':>8}{'prec':>8}{'IoU':>7}{'dconf':>7}{batch_header}")
+    for row in rows:
+        mean_iou = "-" if row["mean_iou"] is None else f"{row['mean_iou']:.3f}"
+        conf_delta = "-" if row["mean_conf_delta"] is None else f"{row['mean_conf_delta']:.3f}"
+        batch_columns = ""
+        if args.batch > 1:
+            batch_columns = "".join(f"{value:>{width}}" for value, width in (
+                ("-" if row["batch_fps"] is None else f"{row['batch_fps']:.2f}", 8),
+                ("-" if row["batch_recall"] is None else f"{row['batch_recall']:.3f}", 7),
+                ("-" if row["batch_precision"] is None else f"{row['batch_precision']:.3f}", 7)))
+        print(f"{row['variant']:<36}{row['fps']:>8.2f}{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}"
+              f"{row['recall']:>8.3f}{row['precision']:>8.3f}{mean_iou:>7}{conf_delta:>7}{batch_columns}{'' if row['passes'] else '  below parity'}")
+    best = max((row for row in rows if row["passes"]), key=lambda row: row["fps"], default=None)
+    if best is None:
+        print("No variant meets parity")
+    else:
+        print(f"Fastest variant meeting parity: {best['variant']} ({best['fps']} FPS)")
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump({"reference": args.reference, "frames": len(frames), "imgsz": args.imgsz, "batch": args.batch,
+                       "results": rows, "recommended": best["variant"] if best else None}, output, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1000 @@
+import argparse
+import binascii
+import builtins
+import heapq
+import json
+import os
+import random
+import re
+import sys
+import traceback
+import types
+from collections import Counter, deque
+from time import perf_counter
+
+# Board wiring as used by ESP32_code.py; slot sensors are found through the firmware's slot_banks
+EXIT_SENSOR_PIN = 14
+ENTRY_SERVO_PIN = 18
+EXIT_SERVO_PIN = 15
+SERVO_OPEN_DUTY = 77
+TOPIC_PREFIX = "parking_system_custom_123456/"
+REACTION_WINDOW_MS = 5000
+
+class SimulationEnd(BaseException):
+    # Unwinds firmware code that is blocked (e.g. in a reconnect loop) when the scenario runs out
+    pass
+
+class CancelledError(BaseException):
+    pass
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+# ---- Virtual-time uasyncio ----
+
+class Task:
+    def __init__(self, sim, coro):
+        self.sim = sim
+        self.coro = coro
+        self.name = getattr(coro, "__qualname__", "task")
+        self.token = 0
+        self.parked = None
+        self.joiners = []
+        self.done = False
+        self.value = None
+        self.error = None
+
+    def cancel(self):
+        if not self.done:
+            self.sim.schedule(self, exc=CancelledError())
+
+    def result(self):
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+class Sleep:
+    def __init__(self, ms):
+        self.ms = ms
+
+    def __await__(self):
+        yield ("sleep", self.ms)
+
+class Park:
+    def __init__(self, waiters):
+        self.waiters = waiters
+
+    def __await__(self):
+        yield ("park", self.waiters)
+
+class Join:
+    def __init__(self, task, timeout_ms):
+        self.task = task
+        self.timeout_ms = timeout_ms
+
+    def __await__(self):
+        yield ("join", self.task, self.timeout_ms)
+
+class Event:
+    def __init__(self):
+        self.state = False
+        self.waiters = []
+
+    def is_set(self):
+        return self.state
+
+    def set(self):
+        self.state = True
+        for task in list(self.waiters):
+            task.sim.schedule(task)
+
+    def clear(self):
+        self.state = False
+
+    async def wait(self):
+        if not self.state:
+            await Park(self.waiters)
+        return True
+
+class ThreadSafeFlag(Event):
+    # Unlike Event, a successful wait consumes the flag
+    async def wait(self):
+        if not self.state:
+            await Park(self.waiters)
+        self.state = False
+
+class Lock:
+    def __init__(self):
+        self.state = False
+        self.waiters = []
+
+    def locked(self):
+        return self.state
+
+    async def acquire(self):
+        while self.state:
+            await Park(self.waiters)
+        self.state = True
+        return True
+
+    def release(self):
+        self.state = False
+        if self.waiters:
+            task = self.waiters[0]
+            task.sim.schedule(task)
+
+    async def __aenter__(self):
+        return await self.acquire()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+def make_uasyncio(sim):
+    async def wait_for_ms(awaitable, timeout_ms):
+        if timeout_ms is None:
+            return await awaitable
+        child = sim.create_task(awaitable)
+        try:
+            await Join(child, timeout_ms)
+        except TimeoutError:
+            child.cancel()
+            raise
+        return child.result()
+
+    def wait_for(awaitable, timeout):
+        return wait_for_ms(awaitable, None if timeout is None else timeout * 1000)
+
+    module = types.ModuleType("uasyncio")
+    module.Event = Event
+    module.ThreadSafeFlag = ThreadSafeFlag
+    module.Lock = Lock
+    module.TimeoutError = TimeoutError
+    module.CancelledError = CancelledError
+    module.sleep = lambda seconds: Sleep(seconds * 1000)
+    module.sleep_ms = Sleep
+    module.wait_for = wait_for
+    module.wait_for_ms = wait_for_ms
+    module.create_task = sim.create_task
+    module.run = sim.run_main
+    return module
+
+def make_time(sim):
+    module = types.ModuleType("time")
+    module.time = lambda: int(sim.now // 1000)
+    module.ticks_ms = lambda: int(sim.now)
+    module.ticks_us = lambda: int(sim.now * 1000)
+    module.ticks_diff = lambda new, old: new - old
+    module.ticks_add = lambda ticks, delta: ticks + delta
+    # Blocking sleeps stall every task, exactly as on the board
+    module.sleep = lambda seconds: sim.block(seconds * 1000)
+    module.sleep_ms = sim.block
+    module.sleep_us = lambda us: sim.block(us / 1000)
+    return module
+
+# ---- Fake hardware ----
+
+def make_machine(sim):
+    class Pin:
+        IN = 1
+        OUT = 3
+        IRQ_RISING = 1
+        IRQ_FALLING = 2
+
+        def __init__(self, pin_id, mode=None, pull=None, value=None):
+            self.id = pin_id
+            self.mode = mode
+            # IR sensors idle high (nothing in front of them)
+            self.level = 1 if mode == Pin.IN else 0
+            if value is not None:
+                self.level = 1 if value else 0
+            self.trigger = 0
+            self.handler = None
+            sim.pins[pin_id] = self
+
+        def value(self, level=None):
+            if level is None:
+                return sim.input_level(self)
+            self.level = 1 if level else 0
+
+        def irq(self, trigger=3, handler=None):
+            self.trigger = trigger
+            self.handler = handler
+
+        def drive(self, level):
+            # Called by the scenario to change what an input sensor reads
+            previous, self.level = self.level, level
+            edge = Pin.IRQ_FALLING if previous and not level else Pin.IRQ_RISING if level and not previous else 0
+            if self.handler is not None and edge & self.trigger:
+                self.handler(self)
+
+    class PWM:
+        def __init__(self, pin, freq=0, duty=0):
+            self.pin = pin
+            self.frequency = freq
+            self.duty_value = duty
+
+        def freq(self, value=None):
+            if value is None:
+                return self.frequency
+            self.frequency = value
+
+        def duty(self, value=None):
+            if value is None:
+                return self.duty_value
+            self.duty_value = value
+            sim.duty_changes.append((sim.now, self.pin.id, value))
+
+    class SPI:
+        # Reads back a 74HC165 chain; bits listed in low read 0 (car present)
+        def __init__(self, bus, baudrate=1000000, sck=None, mosi=None, miso=None, **kwargs):
+            self.bus = bus
+            self.low = set()
+
+        def readinto(self, buf, write=0):
+            value = (1 << 8 * len(buf)) - 1
+            for bit in self.low:
+                value &= ~(1 << bit)
+            buf[:] = value.to_bytes(len(buf), "big")
+            sim.sensor_bytes += len(buf)
+
+    class I2C:
+        def __init__(self, bus, scl=None, sda=None, freq=400000):
+            self.bus = bus
+
+    module = types.ModuleType("machine")
+    module.Pin = Pin
+    module.PWM = PWM
+    module.SPI = SPI
+    module.I2C = I2C
+    return module
+
+def make_ssd1306(sim):
+    class SSD1306_I2C:
+        def __init__(self, width, height, i2c, addr=0x3C):
+            self.width = width
+            self.height = height
+            self.pages = height // 8
+            self.buffer = bytearray(self.pages * width)
+
+        def fill(self, color):
+            self.buffer[:] = bytes([0xFF if color else 0]) * len(self.buffer)
+
+        def fill_rect(self, x, y, w, h, color):
+            pass
+
+        def text(self, string, x, y, color=1):
+            pass
+
+        def write_cmd(self, cmd):
+            pass
+
+        def write_data(self, buf):
+            sim.display_updates += 1
+            sim.display_bytes += len(buf)
+
+        def show(self):
+            self.write_data(self.buffer)
+
+    module = types.ModuleType("ssd1306")
+    module.SSD1306_I2C = SSD1306_I2C
+    return module
+
+def make_network(sim):
+    class WLAN:
+        def __init__(self, interface=0):
+            self.interface = interface
+
+        def active(self, state=None):
+            return True
+
+        def connect(self, ssid, password):
+            if sim.wifi_ready_at is None:
+                sim.wifi_ready_at = sim.now + sim.wifi_connect_ms
+
+        def isconnected(self):
+            return sim.wifi_ready_at is not None and sim.now >= sim.wifi_ready_at
+
+        def ifconfig(self):
+            return ("192.168.4.2", "255.255.255.0", "192.168.4.1", "192.168.4.1")
+
+        def config(self, key):
+            return b"\x24\x0a\xc4\x00\x00\x01" if key == "mac" else None
+
+    module = types.ModuleType("network")
+    module.STA_IF = 0
+    module.AP_IF = 1
+    module.WLAN = WLAN
+    return module
+
+class FakeBroker:
+    def __init__(self, sim):
+        self.sim = sim
+        self.up = True
+        self.clients = []
+        self.retained = {}
+        self.log = []
+        # Host-side listeners, called as tap(topic, payload) for every delivered message
+        self.taps = []
+
+    def publish(self, topic, payload, retain=False, sender=None):
+        if not self.up:
+            return False
+        self.log.append((self.sim.now, topic, payload, retain, sender is not None))
+        if retain:
+            self.retained[topic] = payload
+        for tap in self.taps:
+            tap(topic, payload)
+        for client in self.clients:
+            if client is not sender and client.connected and topic in client.subscriptions:
+                client.inbox.append((topic, payload))
+        return True
+
+    def set_up(self, up):
+        self.up = up
+        if not up:
+            for client in self.clients:
+                client.connected = False
+
+def make_umqtt(sim):
+    broker = sim.broker
+
+    class MQTTException(Exception):
+        pass
+
+    class SimpleMQTTClient:
+        # umqtt.simple semantics: every call raises OSError once the connection is gone
+        def __init__(self, client_id, server, port=0, **kwargs):
+            self.client_id = client_id
+            self.callback = None
+            self.connected = False
+            self.subscriptions = set()
+            self.inbox = deque()
+            broker.clients.append(self)
+
+        def set_callback(self, callback):
+            self.callback = callback
+
+        def connect(self, clean_session=True):
+            if not broker.up:
+                raise OSError(113, "ECONNABORTED")
+            self.connected = True
+            sim.mqtt_connects += 1
+            if clean_session:
+                self.subscriptions.clear()
+            return 0
+
+        def disconnect(self):
+            self.connected = False
+
+        def ping(self):
+            self.check_connection()
+
+        def check_connection(self):
+            if not self.connected:
+                raise OSError(104, "ECONNRESET")
+
+        def publish(self, topic, msg, retain=False, qos=0):
+            self.check_connection()
+            broker.publish(topic, msg, retain, sender=self)
+
+        def subscribe(self, topic, qos=0):
+            self.check_connection()
+            self.subscriptions.add(topic)
+            if topic in broker.retained:
+                self.inbox.append((topic, broker.retained[topic]))
+
+        def check_msg(self):
+            self.check_connection()
+            if self.inbox:
+                topic, msg = self.inbox.popleft()
+                topic = topic.encode() if isinstance(topic, str) else topic
+                msg = msg.encode() if isinstance(msg, str) else msg
+                self.callback(topic, msg)
+
+        def wait_msg(self):
+            return self.check_msg()
+
+    class RobustMQTTClient(SimpleMQTTClient):
+        # umqtt.robust semantics: failures retry a blocking reconnect forever, DELAY seconds apart
+        DELAY = 2
+
+        def delay(self, attempt):
+            sim.block(self.DELAY * 1000)
+
+        def reconnect(self):
+            attempt = 0
+            while True:
+                try:
+                    return SimpleMQTTClient.connect(self, False)
+                except OSError:
+                    attempt += 1
+                    self.delay(attempt)
+
+        def publish(self, topic, msg, retain=False, qos=0):
+            while True:
+                try:
+                    return SimpleMQTTClient.publish(self, topic, msg, retain, qos)
+                except OSError:
+                    pass
+                self.reconnect()
+
+        def check_msg(self, attempts=2):
+            while attempts:
+                try:
+                    return SimpleMQTTClient.check_msg(self)
+                except OSError:
+                    pass
+                self.reconnect()
+                attempts -= 1
+
+    package = types.ModuleType("umqtt")
+    simple = types.ModuleType("umqtt.simple")
+    simple.MQTTClient = SimpleMQTTClient
+    simple.MQTTException = MQTTException
+    robust = types.ModuleType("umqtt.robust")
+    robust.MQTTClient = RobustMQTTClient
+    package.simple = simple
+    package.robust = robust
+    return {"umqtt": package, "umqtt.simple": simple, "umqtt.robust": robust}
+
+# ---- Simulator ----
+
+class Simulator:
+    def __init__(self, duration_ms, wifi_connect_ms=1500, verbose=False):
+        self.duration_ms = duration_ms
+        self.wifi_connect_ms = wifi_connect_ms
+        self.verbose = verbose
+        self.now = 0.0
+        self.sequence = 0
+        self.ready = deque()
+        self.timers = []
+        self.world = []
+        self.tasks = []
+        self.pins = {}
+        self.duty_changes = []
+        self.broker = FakeBroker(self)
+        self.wifi_ready_at = None
+        self.mqtt_connects = 0
+        self.display_updates = 0
+        self.display_bytes = 0
+        self.step_times = {}
+        self.lateness = []
+        self.stalls = []
+        self.errors = []
+        self.log = []
+        self.triggers = []
+        self.firmware = None
+        self.occupied = set()
+        self.mux_low = {}
+        self.sensor_bytes = 0
+
+    # Scheduling
+
+    def create_task(self, coro):
+        task = Task(self, coro)
+        self.tasks.append(task)
+        self.ready.append((task, task.token, None, None))
+        return task
+
+    def schedule(self, task, value=None, exc=None):
+        # Resumes a parked task; bumping the token invalidates any timeout still pending for it
+        if task.parked is not None:
+            if task in task.parked:
+                task.parked.remove(task)
+            task.parked = None
+        task.token += 1
+        self.ready.append((task, task.token, value, exc))
+
+    def add_timer(self, when, task, exc=None):
+        self.sequence += 1
+        heapq.heappush(self.timers, (when, self.sequence, task, task.token, exc))
+
+    def at(self, when, action):
+        # World events (sensors, broker, cars) run on the same virtual clock as the firmware
+        self.sequence += 1
+        heapq.heappush(self.world, (when, self.sequence, action))
+
+    def block(self, ms):
+        # A blocking call on the board: no task runs, but the outside world carries on
+        end = self.now + ms
+        while self.world and self.world[0][0] <= end:
+            when, _, action = heapq.heappop(self.world)
+            self.now = max(self.now, when)
+            action()
+        self.now = end
+        if self.now > self.duration_ms:
+            raise SimulationEnd()
+
+    def step(self, task, value, exc):
+        start = perf_counter()
+        started_at = self.now
+        try:
+            request = task.coro.throw(exc) if exc is not None else task.coro.send(value)
+        except StopIteration as stop:
+            self.finish(task, stop.value, None)
+        except CancelledError as error:
+            self.finish(task, None, error)
+        except SimulationEnd:
+            self.stalls.append(self.now - started_at)
+            raise
+        except Exception as error:
+            self.finish(task, None, error)
+            if not task.joiners:
+                self.errors.append(f"{self.now:.0f} ms {task.name}: {''.join(traceback.format_exception_only(type(error), error)).strip()}")
+        else:
+            self.handle(task, request)
+        self.step_times.setdefault(task.name, []).append(perf_counter() - start)
+        if self.now > started_at:
+            # Virtual time only passes inside a step when the firmware made a blocking call
+            self.stalls.append(self.now - started_at)
+
+    def finish(self, task, value, error):
+        task.done = True
+        task.value = value
+        task.error = error
+        for joiner in list(task.joiners):
+            self.schedule(joiner)
+
+    def handle(self, task, request):
+        kind = request[0]
+        if kind == "sleep":
+            task.wake_at = self.now + max(0, request[1])
+            self.add_timer(task.wake_at, task)
+        elif kind == "park":
+            request[1].append(task)
+            task.parked = request[1]
+        elif kind == "join":
+            child, timeout_ms = request[1], request[2]
+            if child.done:
+                self.ready.append((task, task.token, None, None))
+                return
+            child.joiners.append(task)
+            task.parked = child.joiners
+            if timeout_ms is not None:
+                task.wake_at = None
+                self.add_timer(self.now + timeout_ms, task, TimeoutError())
+
+    def run_main(self, coro):
+        self.create_task(coro)
+        try:
+            while True:
+                while self.ready:
+                    task, token, value, exc = self.ready.popleft()
+                    if token == task.token and not task.done:
+                        self.step(task, value, exc)
+                next_timer = self.timers[0][0] if self.timers else None
+                next_world = self.world[0][0] if self.world else None
+                if next_timer is None and next_world is None:
+                    break
+                if next_world is not None and (next_timer is None or next_world <= next_timer):
+                    if next_world > self.duration_ms:
+                        break
+                    when, _, action = heapq.heappop(self.world)
+                    self.now = max(self.now, when)
+                    action()
+                    continue
+                if next_timer > self.duration_ms:
+                    break
+                when, _, task, token, exc = heapq.heappop(self.timers)
+                if token != task.token or task.done:
+                    continue
+                self.now = max(self.now, when)
+                # How late the loop resumed a task compared to when it asked to wake
+                self.lateness.append(self.now - when)
+                self.schedule(task, exc=exc)
+        except SimulationEnd:
+            pass
+        self.now = max(self.now, self.duration_ms)
+        for task in self.tasks:
+            if not task.done:
+                task.coro.close()
+
+    # Firmware
+
+    def firmware_print(self, *args, **kwargs):
+        line = " ".join(str(arg) for arg in args)
+        self.log.append((self.now, line))
+        if self.verbose:
+            print(f"[{self.now / 1000:9.3f}] {line}")
+
+    def load(self, path, overrides=None):
+        fakes = {
+            "uasyncio": make_uasyncio(self),
+            "time": make_time(self),
+            "machine": make_machine(self),
+            "ssd1306": make_ssd1306(self),
+            "network": make_network(self),
+            "ubinascii": types.SimpleNamespace(hexlify=binascii.hexlify, unhexlify=binascii.unhexlify),
+            "ujson": json
+        }
+        fakes.update(make_umqtt(self))
+        real_import = builtins.__import__
+
+        def firmware_import(name, globals=None, locals=None, fromlist=(), level=0):
+            if name in fakes:
+                return fakes[name] if fromlist or "." not in name else fakes[name.split(".")[0]]
+            return real_import(name, globals, locals, fromlist, level)
+
+        firmware_builtins = dict(vars(builtins))
+        firmware_builtins["__import__"] = firmware_import
+        firmware_builtins["print"] = self.firmware_print
+        module = types.ModuleType("ESP32_code")
+        module.__file__ = path
+        module.__builtins__ = firmware_builtins
+        self.firmware = module
+        with open(path) as source:
+            text = source.read()
+        # Scenarios can swap module-level constants (e.g. SLOT_BANKS) to model other boards
+        for name, value in (overrides or {}).items():
+            text, found = re.subn(rf"^{name} = .*$", lambda match: f"{name} = {value}", text, count=1, flags=re.M)
+            if not found:
+                raise SystemExit(f"{path} has no {name} to override")
+        code = compile(text, path, "exec")
+        # The firmware ends in asyncio.run(main()), so executing it runs the whole scenario
+        exec(code, module.__dict__)
+        return module
+
+    # World helpers used by the scenarios
+
+    def gate_state(self, name):
+        return getattr(self.firmware, f"{name}_state", None)
+
+    def camera_detects(self, when, assign=None):
+        # assign, if given, plays the central occupancy service: it returns the slot_assign payload sent ahead of DETECTED
+        def detect():
+            topic = TOPIC_PREFIX + "vehicle_status"
+            listening = any(client.connected and topic in client.subscriptions for client in self.broker.clients)
+            assigned = assign() if assign is not None else None
+            if assigned is not None:
+                self.broker.publish(TOPIC_PREFIX + "slot_assign", assigned)
+            if assigned == "FULL":
+                # Like the Gui, the service refuses the car itself and sends no DETECTED
+                outcome = "refused"
+            elif not self.broker.publish(topic, "DETECTED"):
+                outcome = "lost"
+            elif not listening:
+                outcome = "offline"
+            elif self.firmware.get_available_slots() == 0:
+                outcome = "full"
+            else:
+                outcome = "extended" if self.gate_state("entry") == "GREEN" else None
+            self.triggers.append(("entry", self.now, outcome))
+        self.at(when, detect)
+
+    def exit_sensor(self, when, hold_ms=1000):
+        pin = self.pins[EXIT_SENSOR_PIN]
+
+        def arrive():
+            self.triggers.append(("exit", self.now, "busy" if self.gate_state("exit") != "RED" else None))
+            pin.drive(0)
+        self.at(when, arrive)
+        self.at(when + hold_ms, lambda: pin.drive(1))
+
+    def input_level(self, pin):
+        if pin.id in self.mux_low:
+            select = self.firmware.MUX_SELECT_PINS
+            channel = sum(self.pins[gpio].level << bit for bit, gpio in enumerate(select))
+            return 0 if channel in self.mux_low[pin.id] else 1
+        return pin.level
+
+    def free_slots(self):
+        return [slot for slot in range(self.firmware.SLOT_COUNT) if slot not in self.occupied]
+
+    def set_slot(self, slot, occupied):
+        # Puts a car in front of (or away from) a slot sensor, whichever bank it is wired to
+        if occupied:
+            self.occupied.add(slot)
+        else:
+            self.occupied.discard(slot)
+        for bank in self.firmware.slot_banks:
+            index = slot - bank.offset
+            if not 0 <= index < bank.count:
+                continue
+            if hasattr(bank, "pins"):
+                bank.pins[index].drive(0 if occupied else 1)
+            elif hasattr(bank, "spi"):
+                (bank.spi.low.add if occupied else bank.spi.low.discard)(index)
+            else:
+                channels = self.mux_low.setdefault(bank.sigs[index // bank.channels].id, set())
+                (channels.add if occupied else channels.discard)(index % bank.channels)
+            return
+
+    def servo_opened(self, pin_id, since):
+        # When the gate was (or already stood) open at or after since
+        open_at = None
+        for when, changed_pin, duty in self.duty_changes:
+            if changed_pin != pin_id:
+                continue
+            if when <= since:
+                open_at = since if duty == SERVO_OPEN_DUTY else None
+            elif open_at is None and duty == SERVO_OPEN_DUTY:
+                return when
+        return open_at
+
+    def reactions(self, kind):
+        pin_id = ENTRY_SERVO_PIN if kind == "entry" else EXIT_SERVO_PIN
+        latencies = []
+        outcomes = Counter()
+        for trigger_kind, when, outcome in self.triggers:
+            if trigger_kind != kind:
+                continue
+            if outcome is not None:
+                outcomes[outcome] += 1
+                continue
+            opened = self.servo_opened(pin_id, when)
+            if opened is None or opened - when > REACTION_WINDOW_MS:
+                outcomes["no_response"] += 1
+            else:
+                latencies.append(opened - when)
+        return latencies, outcomes
+
+# ---- Scenarios ----
+# Each scenario schedules world events on a fresh simulator and returns checks evaluated after the run
+
+class Driver:
+    # A car that, once let in, parks in a free slot and later leaves through the exit
+    # With assign (see Simulator.camera_detects) the car heads for the slot it was given instead
+    def __init__(self, sim, arrive_at, stay_ms=None, park_after_ms=3000, assign=None):
+        self.sim = sim
+        self.arrive_at = arrive_at
+        self.stay_ms = stay_ms
+        self.park_after_ms = park_after_ms
+        self.slot = None
+        self.assigned = None
+        self.admitted = None
+        self.assign = assign
+        sim.camera_detects(arrive_at, self.request_slot if assign is not None else None)
+        sim.at(arrive_at + park_after_ms, self.park)
+
+    def park(self):
+        if self.sim.servo_opened(ENTRY_SERVO_PIN, self.arrive_at) is None:
+            self.admitted = False
+            return
+        free = self.sim.free_slots()
+        if not free:
+            self.admitted = False
+            return
+        self.admitted = True
+        self.slot = self.assigned - 1 if self.assigned not in (None, "FULL") else free[0]
+        self.sim.set_slot(self.slot, True)
+        if self.stay_ms is not None:
+            leave_at = self.sim.now + self.stay_ms
+            self.sim.at(leave_at, lambda: self.sim.set_slot(self.slot, False))
+            self.sim.exit_sensor(leave_at + 3000)
+
+    def request_slot(self):
+        self.assigned = self.assign()
+        return None if self.assigned is None else str(self.assigned)
+
+def expect(name, ok, detail=""):
+    return {"check": name, "ok": bool(ok), "detail": detail}
+
+def delta_mask(sim):
+    payload = sim.broker.retained.get(TOPIC_PREFIX + "slot_delta")
+    return json.loads(payload)["mask"] if payload else None
+
+def scenario_arrivals(sim, rng):
+    drivers = []
+    arrive_at = 5000
+    for _ in range(12):
+        arrive_at += rng.randint(6000, 15000)
+        drivers.append(Driver(sim, arrive_at, stay_ms=rng.randint(15000, 40000)))
+
+    def checks():
+        entry, entry_outcomes = sim.reactions("entry")
+        exits, exit_outcomes = sim.reactions("exit")
+        return [
+            expect("every car let in", all(driver.admitted for driver in drivers), f"{sum(1 for d in drivers if d.admitted)}/{len(drivers)}"),
+            expect("entry gate answered every request", not entry_outcomes["no_response"], dict(entry_outcomes)),
+            expect("exit gate answered every car", not exit_outcomes["no_response"], dict(exit_outcomes)),
+            expect("retained slot state matches the board", delta_mask(sim) == sim.firmware.slot_mask)
+        ]
+    return checks
+
+def scenario_fill(sim, rng):
+    drivers = [Driver(sim, 5000 + i * 7000) for i in range(8)]
+
+    def checks():
+        return [
+            expect("first six cars let in", all(driver.admitted for driver in drivers[:6])),
+            expect("cars refused once full", not any(driver.admitted for driver in drivers[6:])),
+            expect("slot_status reports FULL", sim.broker.retained.get(TOPIC_PREFIX + "slot_status") == "FULL",
+                   sim.broker.retained.get(TOPIC_PREFIX + "slot_status")),
+            expect("retained slot state matches the board", delta_mask(sim) == sim.firmware.slot_mask)
+        ]
+    return checks
+
+def scenario_broker_drop(sim, rng):
+    drivers = []
+    arrive_at = 5000
+    for _ in range(10):
+        arrive_at += rng.randint(5000, 10000)
+        drivers.append(Driver(sim, arrive_at, stay_ms=rng.randint(10000, 30000)))
+    sim.at(30000, lambda: sim.broker.set_up(False))
+    sim.at(70000, lambda: sim.broker.set_up(True))
+
+    def checks():
+        exits, exit_outcomes = sim.reactions("exit")
+        return [
+            expect("device reconnected", sim.mqtt_connects >= 2, f"{sim.mqtt_connects} connects"),
+            expect("exit gate answered every car", not exit_outcomes["no_response"], dict(exit_outcomes)),
+            expect("retained slot state matches the board after recovery", delta_mask(sim) == sim.firmware.slot_mask)
+        ]
+    return checks
+
+def scenario_large_lot(sim, rng):
+    # More cars than slots arrive over a few minutes, a few leave; the lot ends up full
+    drivers = []
+    arrive_at = 5000
+    for _ in range(90):
+        arrive_at += rng.randint(2500, 4000)
+        drivers.append(Driver(sim, arrive_at, stay_ms=rng.randint(20000, 60000) if rng.random() < 0.1 else None))
+    # Page shown each second; slots change more often than DISPLAY_PAGE_MS, which must not hold paging back
+    pages = []
+    for when in range(1000, sim.duration_ms, 1000):
+        sim.at(when, lambda: pages.append(sim.firmware.display_page))
+
+    def checks():
+        admitted = sum(1 for driver in drivers if driver.admitted)
+        parked = len(sim.occupied)
+        flips = sum(1 for before, after in zip(pages, pages[1:]) if before != after)
+        expected = sim.duration_ms // sim.firmware.DISPLAY_PAGE_MS
+        return [
+            expect("lot filled", parked == sim.firmware.SLOT_COUNT, f"{parked}/{sim.firmware.SLOT_COUNT} occupied, {admitted} admitted"),
+            expect("board agrees with the sensors", sim.firmware.slot_mask == sum(1 << slot for slot in sim.occupied)),
+            expect("retained slot state matches the board", delta_mask(sim) == sim.firmware.slot_mask),
+            expect("display paged on schedule", len(set(pages)) == sim.firmware.DISPLAY_PAGES and flips >= expected * 9 // 10,
+                   f"{sim.firmware.DISPLAY_PAGES} pages, {flips} flips of {expected}")
+        ]
+    return checks
+
+def scenario_central_assign(sim, rng):
+    # Gui's OccupancyService hands out the slots, fed by the board's slot_delta messages as the Gui feeds it. Its
+    # slot order starts at slot 5 so assignments differ from the board's own pick, and slot 6 is held for a
+    # reservation, so the sixth car is refused although its IR sensor still reads free. Cars take 10 s to park
+    # while the next arrives after 6 s, so assignments are held across several IR scans
+    from Gui import OccupancyService
+    reserved = 6
+    service = OccupancyService(slots=[5, 4, 3, 2, 1, reserved])
+    service.apply_reservation({'slot_id': reserved, 'duration': 60, 'status': "active"}, now=0)
+    doubled = []
+
+    def feed(topic, payload):
+        if topic == TOPIC_PREFIX + "slot_delta":
+            service.update_mask("ir", json.loads(payload)["mask"], sim.now / 1000)
+    sim.broker.taps.append(feed)
+
+    def assign():
+        slot = service.assign(sim.now / 1000)
+        if slot is None:
+            return "FULL"
+        # Still held if a car sent there earlier has not parked yet, taken if its sensor reads occupied
+        if slot - 1 not in sim.free_slots() or any(driver.assigned == slot and driver.admitted is None for driver in drivers):
+            doubled.append((sim.now, slot))
+        return slot
+    drivers = [Driver(sim, 5000 + i * 6000, stay_ms=30000 if i == 0 else None, park_after_ms=10000, assign=assign)
+               for i in range(6)]
+    drivers.append(Driver(sim, 55000, park_after_ms=10000, assign=assign))
+
+    def checks():
+        admitted = [driver for driver in drivers if driver.admitted]
+        announced = [line for when, line in sim.log if line.startswith("Slot assigned:")]
+        occupied = {slot + 1 for slot in sim.occupied}
+        return [
+            expect("first five cars let in", admitted[:5] == drivers[:5], f"{len(admitted)} admitted"),
+            expect("slots handed out in the service's order", [driver.assigned for driver in drivers[:5]] == [5, 4, 3, 2, 1],
+                   [driver.assigned for driver in drivers[:5]]),
+            expect("no slot assigned twice while held", not doubled, doubled),
+            expect("cars parked where they were sent", all(driver.slot == driver.assigned - 1 for driver in admitted),
+                   [driver.assigned for driver in admitted]),
+            expect("firmware took every assignment", len(announced) == len(admitted), f"{len(announced)} announced"),
+            expect("FULL refused the sixth car", drivers[5].assigned == "FULL" and not drivers[5].admitted),
+            expect("freed slot handed out again", drivers[6].admitted and drivers[6].assigned == 5, drivers[6].assigned),
+            expect("reserved slot left free", reserved - 1 in sim.free_slots()),
+            expect("service agrees with the sensors", service.occupied == occupied, sorted(service.occupied)),
+            expect("no holds left on the board", sim.firmware.held_mask == 0, bin(sim.firmware.held_mask)),
+            expect("board agrees with the sensors", sim.firmware.slot_mask == sum(1 << slot for slot in sim.occupied)),
+            expect("retained slot state matches the board", delta_mask(sim) == sim.firmware.slot_mask)
+        ]
+    return checks
+
+SCENARIOS = {
+    "arrivals": (scenario_arrivals, 240000, None),
+    "fill": (scenario_fill, 80000, None),
+    "broker_drop": (scenario_broker_drop, 180000, None),
+    # 75 slots: three sensors on GPIOs and nine 74HC165s
+    "large_lot": (scenario_large_lot, 360000, {"SLOT_BANKS": '[("pins", (34, 35, 36)), ("shift", 72)]'}),
+    # 33 slots: one GPIO sensor and two 16-channel multiplexers
+    "mux_lot": (scenario_arrivals, 240000, {"SLOT_BANKS": '[("pins", (34,)), ("mux", (35, 36), 16)]'}),
+    "central_assign": (scenario_central_assign, 70000, None)
+}
+
+def summarize(values, scale=1.0, digits=3):
+    if not values:
+        return {"n": 0}
+    return {
+        "n": len(values),
+        "p50": round(percentile(values, 50) * scale, digits),
+        "p95": round(percentile(values, 95) * scale, digits),
+        "max": round(max(values) * scale, digits)
+    }
+
+def run_scenario(name, firmware, seed, verbose=False):
+    build, duration_ms, overrides = SCENARIOS[name]
+    sim = Simulator(duration_ms, verbose=verbose)
+    checks = build(sim, random.Random(seed))
+    start = perf_counter()
+    sim.load(firmware, overrides)
+    host_seconds = perf_counter() - start
+    entry, entry_outcomes = sim.reactions("entry")
+    exits, exit_outcomes = sim.reactions("exit")
+    taken = bin(sim.firmware.slot_mask | sim.firmware.held_mask).count("1")
+    results = checks() + [
+        expect("free count matches the slot and hold masks", sim.firmware.get_available_slots() == sim.firmware.SLOT_COUNT - taken),
+        expect("no firmware task crashed", not sim.errors, sim.errors[:3])
+    ]
+    published = Counter(topic[len(TOPIC_PREFIX):] for _, topic, _, _, from_device in sim.broker.log if from_device)
+    return {
+        "scenario": name,
+        "simulated_s": duration_ms / 1000,
+        "host_s": round(host_seconds, 3),
+        "entry_reaction_ms": dict(summarize(entry), **entry_outcomes),
+        "exit_reaction_ms": dict(summarize(exits), **exit_outcomes),
+        "loop_lateness_ms": summarize(sim.lateness, digits=1),
+        "blocked_ms": {"steps": len(sim.stalls), "total": round(sum(sim.stalls), 1), "max": round(max(sim.stalls), 1) if sim.stalls else 0},
+        "task_step_us": {task: summarize(times, scale=1e6, digits=1) for task, times in sorted(sim.step_times.items())},
+        "mqtt_published": dict(published),
+        "mqtt_connects": sim.mqtt_connects,
+        "display": {"updates": sim.display_updates, "bytes": sim.display_bytes},
+        "slot_sensor_bytes": sim.sensor_bytes,
+        "checks": results
+    }
+
+def format_summary(summary, unit):
+    if not summary.get("n"):
+        return "n=0"
+    extra = "".join(f"  {key} {value}" for key, value in summary.items() if key not in ("n", "p50", "p95", "max"))
+    return f"n={summary['n']}  p50 {summary['p50']}{unit}  p95 {summary['p95']}{unit}  max {summary['max']}{unit}{extra}"
+
+def print_report(report):
+    print(f"Scenario {report['scenario']}: {report['simulated_s']:.0f} s simulated in {report['host_s']} s")
+    print(f"  entry gate reaction            {format_summary(report['entry_reaction_ms'], ' ms')}")
+    print(f"  exit gate reaction             {format_summary(report['exit_reaction_ms'], ' ms')}")
+    print(f"  loop lateness                  {format_summary(report['loop_lateness_ms'], ' ms')}")
+    blocked = report["blocked_ms"]
+    print(f"  blocked steps                  {blocked['steps']}  total {blocked['total']} ms  max {blocked['max']} ms")
+    for task, summary in report["task_step_us"].items():
+        print(f"  step {task:<26}{format_summary(summary, ' us')}")
+    published = ", ".join(f"{topic} {count}" for topic, count in sorted(report["mqtt_published"].items()))
+    print(f"  mqtt published                 {published}  ({report['mqtt_connects']} connects)")
+    print(f"  display                        {report['display']['updates']} updates, {report['display']['bytes']} bytes")
+    for check in report["checks"]:
+        detail = f"  ({check['detail']})" if check["detail"] not in ("", None, [], {}) else ""
+        print(f"  {'PASS' if check['ok'] else 'FAIL'}  {check['check']}{detail}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run ESP32_code.py on the host against simulated sensors, gates, WiFi and MQTT broker with a virtual clock.")
+    parser.add_argument("scenarios", nargs="*", help=f"scenarios to run: {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("--firmware", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "ESP32_code.py"))
+    parser.add_argument("--seed", type=int, default=1, help="seed for arrival times and parking durations")
+    parser.add_argument("--verbose", action="store_true", help="print firmware output with virtual timestamps")
+    parser.add_argument("--json", help="write the reports to this file")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario: {', '.join(unknown)}")
+
+    reports = [run_scenario(name, args.firmware, args.seed, args.verbose) for name in args.scenarios or SCENARIOS]
+    for report in reports:
+        print_report(report)
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(reports, output, indent=2)
+    if not all(check["ok"] for report in reports for check in report["checks"]):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()